@@ -0,0 +1,41 @@
+"""
+Size and export time of each /download_logs format on a large log, with
+round-trip checks (gzip members decompress to the plain output, NDJSON and
+Arrow carry every row).
+
+    python bench/bench_formats.py [--rows 1000000]
+"""
+import argparse
+import gzip
+import time
+
+from common import fill_logs, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    fc = load_app()
+    fill_logs(fc, args.rows)
+    client = fc.app.test_client()
+
+    bodies = {}
+    for fmt, _ in fc.download_format_choices():
+        started = time.perf_counter()
+        body = b"".join(client.get(f"/download_logs?format={fmt}").response)
+        elapsed = time.perf_counter() - started
+        bodies[fmt] = body
+        print(f"{fmt:10s} {len(body) / 1e6:8.1f} MB {elapsed:7.2f} s")
+
+    assert gzip.decompress(bodies["csv.gz"]) == bodies["csv"]
+    assert gzip.decompress(bodies["ndjson.gz"]) == bodies["ndjson"]
+    assert bodies["ndjson"].count(b"\n") == args.rows
+    if "arrow" in bodies:
+        import pyarrow as pa
+        assert pa.ipc.open_stream(bodies["arrow"]).read_all().num_rows == args.rows
+    print("round trips ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Rows/sec of the shared log-row formatting pipeline on a large log: the full
+logs.csv rebuild and a streamed /download_logs CSV.
+
+    python bench/bench_log_format.py [--rows 1000000]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from common import fill_logs, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    fc = load_app()
+    fill_logs(fc, args.rows)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fc.export_logs_to_file()
+    elapsed = time.perf_counter() - started
+    print(f"logs.csv rebuild: {args.rows / elapsed:,.0f} rows/s ({elapsed:.2f} s)")
+
+    client = fc.app.test_client()
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in client.get("/download_logs").response)
+    elapsed = time.perf_counter() - started
+    print(f"download_logs:    {args.rows / elapsed:,.0f} rows/s ({elapsed:.2f} s, {size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
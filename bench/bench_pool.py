@@ -0,0 +1,84 @@
+"""
+Requests/sec for mixed dashboard + lock/unlock traffic, with the connection
+pool (WAL, busy_timeout, statement cache) and with --no-pool, which opens a
+fresh rollback-journal connection per get_db() call the way the app did
+before the pool.
+
+    python bench/bench_pool.py [--no-pool] [--threads 16] [--requests 150]
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from common import eta_in, load_app, serve
+
+
+def unpooled(fc):
+    conn = fc.get_db()
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    fc.close_db_pool()
+
+    def get_db():
+        conn = sqlite3.connect(fc.DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+    fc.get_db = get_db
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-pool", action="store_true")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=150, help="per thread")
+    args = parser.parse_args()
+
+    fc = load_app()
+    fc.start_export_worker()
+    if args.no_pool:
+        unpooled(fc)
+    port = serve(fc.app)
+    eta = eta_in()
+    done, errors = [0], [0]
+    lock = threading.Lock()
+
+    def client(device_id):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        for i in range(args.requests):
+            try:
+                if i % 3 == 0:
+                    conn.request("GET", "/")
+                elif i % 3 == 1:
+                    conn.request("POST", f"/lock/{device_id}", urllib.parse.urlencode({"user": "a", "eta": eta}),
+                                 {"Content-Type": "application/x-www-form-urlencoded"})
+                else:
+                    conn.request("POST", f"/unlock/{device_id}")
+                response = conn.getresponse()
+                response.read()
+                failed = response.status >= 500
+            except (OSError, http.client.HTTPException):
+                failed = True
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+            with lock:
+                done[0] += 1
+                errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i % 15 + 1,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - started
+    mode = "no pool" if args.no_pool else "pool"
+    print(f"{mode}: {done[0] / elapsed:.0f} req/s over {done[0]} requests, {errors[0]} errors")
+
+
+if __name__ == "__main__":
+    main()
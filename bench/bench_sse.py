@@ -0,0 +1,62 @@
+"""
+Fan-out latency of /events on one process: N subscribers connect, one lock is
+posted, and the time until every stream has seen the event is reported.
+
+    python bench/bench_sse.py [--subscribers 200]
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import socket
+import threading
+import time
+import urllib.parse
+
+from common import eta_in, load_app, serve
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=200)
+    args = parser.parse_args()
+    n = args.subscribers
+    fc = load_app()
+    port = serve(fc.app)
+    got = []
+    got_lock = threading.Lock()
+    ready = threading.Barrier(n + 1)
+
+    def subscriber():
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(b"GET /events HTTP/1.1\r\nHost: bench\r\n\r\n")
+        stream = sock.makefile("rb")
+        while b"retry" not in stream.readline():
+            pass
+        ready.wait()
+        while not stream.readline().startswith(b"event: lock"):
+            pass
+        with got_lock:
+            got.append(time.perf_counter())
+
+    for _ in range(n):
+        threading.Thread(target=subscriber, daemon=True).start()
+    ready.wait()
+    time.sleep(0.2)
+
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        conn.request("POST", "/lock/1", urllib.parse.urlencode({"user": "a", "eta": eta_in()}),
+                     {"Content-Type": "application/x-www-form-urlencoded"})
+        conn.getresponse().read()
+    written = time.perf_counter()
+    while len(got) < n and time.perf_counter() - started < 10:
+        time.sleep(0.005)
+    times = sorted(t - started for t in got)
+    print(f"{n} subscribers: {len(times)} delivered, write {1000 * (written - started):.1f} ms, "
+          f"p50 {1000 * times[len(times) // 2]:.1f} ms, last {1000 * times[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
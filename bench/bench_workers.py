@@ -0,0 +1,104 @@
+"""
+Throughput of `finalcode.py serve` by worker count: 4 client processes x 8
+keep-alive threads send 90% GET /api/devices and 10% lock/unlock pairs.
+Scaling needs as many free cores as workers plus clients.
+
+    python bench/bench_workers.py [--workers 1 2 4] [--seconds 8]
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from common import APP_FILE, eta_in
+
+CLIENT_PROCESSES = 4
+CLIENT_THREADS = 8
+
+
+def client(port, seconds, results):
+    eta = eta_in()
+    counts = {"get": 0, "write": 0, "busy": 0, "error": 0}
+    lock = threading.Lock()
+
+    def run(seed):
+        rnd = random.Random(seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        end = time.time() + seconds
+        while time.time() < end:
+            try:
+                if rnd.random() < 0.1:
+                    device_id = rnd.randint(1, 15)
+                    for path, body in ((f"/lock/{device_id}", f"user=L&eta={eta}"), (f"/unlock/{device_id}", "")):
+                        conn.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded",
+                                                          "Accept": "application/json"})
+                        response = conn.getresponse()
+                        response.read()
+                        with lock:
+                            counts["busy" if response.status == 503 else "write"] += 1
+                else:
+                    conn.request("GET", "/api/devices?page_size=50")
+                    conn.getresponse().read()
+                    with lock:
+                        counts["get"] += 1
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    counts["error"] += 1
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+
+    threads = [threading.Thread(target=run, args=(os.getpid() * 100 + i,)) for i in range(CLIENT_THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put(counts)
+
+
+def measure(workers, seconds, port):
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    server = subprocess.Popen([sys.executable, APP_FILE, "serve", "--workers", str(workers), "--port", str(port)],
+                              cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats")
+                break
+            except OSError:
+                time.sleep(0.1)
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(port, seconds, results))
+                   for _ in range(CLIENT_PROCESSES)]
+        for p in clients:
+            p.start()
+        counts = [results.get() for _ in clients]
+        for p in clients:
+            p.join()
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+    total = {k: sum(c[k] for c in counts) for k in counts[0]}
+    served = total["get"] + total["write"] + total["busy"]
+    print(f"workers={workers}: {served / seconds:.0f} req/s {total}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=int, default=8)
+    parser.add_argument("--port", type=int, default=5090)
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPU(s)")
+    for n in args.workers:
+        measure(n, args.seconds, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Shared setup for the benchmarks. Each one runs the app from a fresh temporary
+directory (its own devices.db / logs.csv), e.g. from the repo root:
+
+    python bench/bench_pool.py
+"""
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(ROOT, "finalcode.py")
+
+
+def load_app():
+    """chdir into an empty temp dir, import finalcode and create its database"""
+    os.chdir(tempfile.mkdtemp(prefix="bench-"))
+    sys.path.insert(0, ROOT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import finalcode
+        finalcode.init_db()
+    return finalcode
+
+
+def serve(app):
+    """threaded werkzeug server on a free port, request logging off; returns the port"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    WSGIRequestHandler.log_request = lambda *a, **k: None
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+def eta_in(hours=2):
+    return (datetime.now() + timedelta(hours=hours)).isoformat(timespec="minutes")
+
+
+def fill_logs(fc, n, seed=7):
+    """n completed sessions (the last one open) spread over 15 devices, start_ts / end_ts filled"""
+    rnd = random.Random(seed)
+    base = datetime(2025, 1, 1)
+
+    def rows():
+        for i in range(n):
+            start = base + timedelta(minutes=i // 3)
+            end = start + timedelta(minutes=rnd.randrange(1, 600))
+            yield (rnd.randint(1, 15), rnd.choice(["ALICE", "BOB", "CAROL", "DAVE"]),
+                   start.isoformat(timespec="minutes"), None if i == n - 1 else end.isoformat(timespec="minutes"))
+
+    conn = sqlite3.connect(fc.DB_PATH)
+    conn.executemany("INSERT INTO logs (device_id, user, start_time, end_time) VALUES (?, ?, ?, ?)", rows())
+    conn.commit()
+    conn.close()
+    fc.BACKFILL_PAUSE_SECONDS = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        fc.backfill_log_epochs()
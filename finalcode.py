@@ -1,1209 +1,4154 @@
-# app.py - Vamsy + ChatGPT full merged version (dark history fixed)
-from flask import Flask, render_template_string, request, redirect, url_for, make_response
-import sqlite3, os, socket, traceback, sys, csv, io
-from datetime import datetime, timedelta
-
-DB_PATH = "devices.db"
-LOG_FILE = "logs.csv"
-REFRESH_MS = 30000  # 30 seconds
-app = Flask(__name__)
-
-# ---------- discover host IPs (for owner-only actions) ----------
-def discover_local_ips():
-    ips = set(["127.0.0.1", "::1"])
-    try:
-        hn_ip = socket.gethostbyname(socket.gethostname())
-        if hn_ip:
-            ips.add(hn_ip)
-    except Exception:
-        pass
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ips.add(s.getsockname()[0])
-        s.close()
-    except Exception:
-        pass
-    return ips
-
-ALLOWED_HOST_IPS = discover_local_ips()
-print("Allowed host IPs:", ALLOWED_HOST_IPS)
-
-def is_request_from_host():
-    ip = request.remote_addr
-    return ip in ALLOWED_HOST_IPS
-
-# ---------- helper formatting ----------
-def format_eta_display(eta_str):
-    try:
-        dt = datetime.fromisoformat(eta_str)
-        return dt.strftime("%d-%m-%Y %I:%M %p")
-    except Exception:
-        return eta_str or "-"
-
-def compute_duration(start_str, end_str):
-    """duration like '2h 10m' or '15m' or '-'"""
-    if not start_str or not end_str:
-        return "-"
-    try:
-        st = datetime.fromisoformat(start_str)
-        et = datetime.fromisoformat(end_str)
-        delta = et - st
-        total_minutes = int(delta.total_seconds() // 60)
-        if total_minutes < 0:
-            return "-"
-        hours = total_minutes // 60
-        minutes = total_minutes % 60
-        if hours > 0:
-            return f"{hours}h {minutes}m"
-        else:
-            return f"{minutes}m"
-    except Exception:
-        return "-"
-
-# ---------- export logs to CSV (per-day serial + partition rows) ----------
-def export_logs_to_file():
-    """
-    Writes logs to LOG_FILE as CSV with:
-      date, serial (resets each day), device_id, device_name, user,
-      start_time, end_time, duration, status
-    and blank row between days.
-    """
-    try:
-        conn = get_db()
-        rows = conn.execute("""
-            SELECT l.id,
-                   l.device_id,
-                   d.name AS device_name,
-                   l.user,
-                   l.start_time,
-                   l.end_time
-            FROM logs l
-            JOIN devices d ON d.id = l.device_id
-            ORDER BY date(l.start_time) ASC, l.start_time ASC, l.id ASC
-        """).fetchall()
-        conn.close()
-
-        with open(LOG_FILE, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "date", "serial", "device_id", "device_name",
-                "user", "start_time", "end_time", "duration", "status"
-            ])
-
-            current_date = None
-            serial = 0
-
-            for r in rows:
-                start_str = r["start_time"]
-                end_str = r["end_time"]
-
-                # parse start datetime
-                try:
-                    st_dt = datetime.fromisoformat(start_str)
-                    date_str = st_dt.strftime("%Y-%m-%d")
-                    start_time_str = st_dt.strftime("%H:%M")
-                except Exception:
-                    date_str = ""
-                    start_time_str = ""
-
-                if end_str:
-                    try:
-                        et_dt = datetime.fromisoformat(end_str)
-                        end_time_str = et_dt.strftime("%H:%M")
-                    except Exception:
-                        end_time_str = ""
-                    status = "Completed"
-                else:
-                    end_time_str = ""
-                    status = "Ongoing"
-
-                duration = compute_duration(start_str, end_str)
-
-                # new date group
-                if date_str != current_date:
-                    if current_date is not None:
-                        writer.writerow([])  # partition row
-                    current_date = date_str
-                    serial = 1
-                else:
-                    serial += 1
-
-                writer.writerow([
-                    date_str,
-                    serial,
-                    r["device_id"],
-                    r["device_name"],
-                    r["user"],
-                    start_time_str,
-                    end_time_str,
-                    duration,
-                    status
-                ])
-
-        print(f"[LOG EXPORT] Logs written to {LOG_FILE}")
-    except Exception as e:
-        print("[LOG EXPORT] Failed to export logs:", e)
-        traceback.print_exc()
-
-# ---------- HTML TEMPLATE ----------
-TEMPLATE = """<!doctype html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <title>Device Availability Dashboard</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-
-  <style>
-    /* ---------- theme variables ---------- */
-    :root{
-      --bg: linear-gradient(135deg,#4285F4 0%,#EA4335 25%,#FBBC05 50%,#34A853 75%,#4285F4 100%);
-      --card-bg: rgba(255,255,255,0.96);
-      --text: #0f172a;
-      --muted: #475569;
-      --panel: #d1fae5;
-      --panel-red: #fee2e2;
-      --thead-bg: #0f172a;
-      --thead-color: #f8fafc;
-      --accent: #111827;
-      --shadow: rgba(0,0,0,0.35);
-      --button-bg: #111827;
-      --button-color: #fff;
-    }
-
-    html[data-theme="dark"]{
-      --bg: linear-gradient(135deg,#0f172a 0%, #0b3d91 40%, #07172a 100%);
-      --card-bg: rgba(6,10,24,0.92);
-      --text: #e6eef8;
-      --muted: #a8b3c6;
-      --panel: rgba(16,64,48,0.25);
-      --panel-red: rgba(139, 30, 40, 0.12);
-      --thead-bg: #071028;
-      --thead-color: #e6eef8;
-      --accent: #9cc3ff;
-      --shadow: rgba(0,0,0,0.7);
-      --button-bg: #e6eef8;
-      --button-color: #071028;
-    }
-
-    * { box-sizing: border-box; }
-    body {
-      margin: 0;
-      font-family: system-ui, -apple-system, "Segoe UI", Roboto, "Helvetica Neue", Arial;
-      font-weight: 700;
-      background: var(--bg);
-      color: var(--text);
-      min-height: 100vh;
-      display: flex;
-      align-items: flex-start;
-      justify-content: center;
-      padding: 16px;
-    }
-
-    .container {
-      width: 95vw;
-      max-width: 2000px;
-      background: var(--card-bg);
-      border-radius: 26px;
-      padding: 28px 32px 32px;
-      box-shadow: 0 25px 45px var(--shadow);
-      backdrop-filter: blur(8px);
-      display: flex;
-      flex-direction: column;
-    }
-
-    .header { display:flex; justify-content:space-between; align-items:baseline; margin-bottom:12px; gap:12px; }
-    h2 { margin:0; font-size:28px; color:var(--text); }
-    .subtitle { font-size:12px; color:var(--muted); font-weight:700; }
-
-    .controls { display:flex; gap:12px; align-items:center; }
-    .btn-action {
-      padding:8px 14px; border-radius:999px; border:none; cursor:pointer; font-weight:800; text-transform:uppercase;
-      background:var(--button-bg); color:var(--button-color);
-      box-shadow: 0 6px 12px rgba(0,0,0,0.12);
-      font-size:12px;
-      white-space:nowrap;
-    }
-
-    .table-wrapper {
-      margin-top: 8px;
-      border-radius: 8px;
-    }
-
-    table { width:100%; border-collapse:collapse; font-size:14px; }
-    thead th {
-      position: sticky; top:0;
-      background: var(--thead-bg); color: var(--thead-color); padding:12px 10px; text-align:left;
-      z-index:2; border-bottom:3px solid var(--thead-bg);
-    }
-    th, td { padding:8px 10px; vertical-align:middle; font-weight:700; }
-    tbody tr { transition: transform 160ms cubic-bezier(.2,.9,.2,1), box-shadow 160ms cubic-bezier(.2,.9,.2,1); transform-origin:center; position:relative; z-index:0; }
-    tbody tr:hover, tbody tr.row-popped, tbody tr:focus-within {
-      transform: translateY(-4px) scale(1.01);
-      box-shadow: 0 12px 22px rgba(15,23,42,0.12);
-      z-index:3;
-    }
-
-    .status-available { background: var(--panel); }
-    .status-inuse, .status-maintenance { background: var(--panel-red); }
-
-    .tag { display:inline-block; padding:3px 8px; border-radius:999px; font-size:10px; text-transform:uppercase; letter-spacing:.03em; }
-    .status-available .tag { background:#16a34a; color:#052e16; }
-    .status-inuse .tag { background:#ef4444; color:#fff; }
-
-    .eta-badge { display:inline-block; padding:4px 8px; border-radius:999px; font-size:11px; font-weight:800; color:#fff; }
-    .eta-active { background:#10b981; }
-    .eta-passed { background:#ef4444; }
-    .eta-none { background:#9ca3af; }
-
-    .btn { padding:5px 10px; border-radius:999px; border:none; cursor:pointer; font-size:11px; font-weight:800; text-transform:uppercase; white-space:nowrap; }
-    .btn-lock { background:#2563eb; color:#fff; }
-    .btn-unlock { background:#16a34a; color:#fff; }
-    .btn-edit { background:#f59e0b; color:#fff; }
-    .btn-delete { background:#ef4444; color:#fff; }
-    .btn-small { padding:4px 8px; font-size:10px; border-radius:8px; }
-
-    form.inline {
-      display:inline-flex;
-      align-items:center;
-      gap:6px;
-      flex-wrap:nowrap;
-      white-space:nowrap;
-    }
-
-    input[type="text"], input[type="datetime-local"], input[type="date"] {
-      border-radius:999px; border:1px solid #d1d5db; padding:4px 8px; font-size:11px; font-weight:700;
-    }
-    input[type="text"] { max-width:110px; }
-    input[type="datetime-local"] { background:#fff; max-width:170px; }
-
-    html[data-theme="dark"] input[type="text"],
-    html[data-theme="dark"] input[type="datetime-local"],
-    html[data-theme="dark"] input[type="date"] {
-      background: rgba(255,255,255,0.03);
-      border-color: rgba(255,255,255,0.06);
-      color: var(--text);
-    }
-
-    .user-name-display {
-      text-transform: uppercase;
-      font-size: 14px;
-      font-weight: 900;
-      letter-spacing: 0.5px;
-      color: var(--text);
-    }
-
-    .action-group {
-      display:flex;
-      align-items:center;
-      gap:6px;
-      flex-wrap:nowrap;
-      white-space:nowrap;
-    }
-
-    /* modals */
-    .modal-backdrop { position: fixed; inset: 0; background: rgba(0,0,0,0.45); display:none; align-items:center; justify-content:center; z-index:9999; }
-    .modal { background:#fff; border-radius:12px; padding:18px; width:480px; max-width:96%; box-shadow: 0 12px 30px rgba(0,0,0,0.35); text-align:center; font-weight:700; }
-    .modal h3 { margin:0 0 8px 0; font-size:18px; color:#0f172a; }
-    .modal p { margin:0 0 16px 0; font-size:14px; color:#475569; font-weight:700; }
-    .modal .actions { display:flex; gap:10px; justify-content:center; margin-top:12px; }
-    .modal .actions button { padding:8px 14px; border-radius:999px; border:none; cursor:pointer; font-weight:800; text-transform:uppercase; font-size:12px; }
-    .btn-yes { background:#16a34a; color:#fff; }
-    .btn-no { background:#ef4444; color:#fff; }
-
-    .modal form input[type="text"] { width:100%; border-radius:8px; padding:10px; font-weight:700; }
-
-    .time-display { margin-left:8px; font-weight:800; font-size:11px; color:var(--text); }
-
-    /* History section */
-    .history-section { margin-top:22px; }
-    .history-header-row {
-      display:flex;
-      justify-content:space-between;
-      align-items:center;
-      gap:12px;
-      flex-wrap:wrap;
-    }
-    .history-title { margin:0 0 4px 0; font-size:18px; color:var(--text); }
-    .history-note { font-size:12px; color:var(--muted); font-weight:700; margin-bottom:4px; }
-
-    .download-form {
-      display:flex;
-      align-items:center;
-      gap:8px;
-      flex-wrap:wrap;
-      font-size:11px;
-    }
-    .download-form label { display:flex; align-items:center; gap:4px; }
-    .btn-download {
-      padding:6px 12px;
-      border-radius:999px;
-      border:none;
-      cursor:pointer;
-      font-size:11px;
-      font-weight:800;
-      text-transform:uppercase;
-      background:var(--button-bg);
-      color:var(--button-color);
-      box-shadow:0 4px 10px rgba(0,0,0,0.18);
-      white-space:nowrap;
-    }
-
-    .history-table-wrapper { margin-top:8px; border-radius:8px; }
-
-    /* use theme colours for history header */
-    .history-table thead th {
-      background: var(--thead-bg);
-      color: var(--thead-color);
-    }
-
-    /* light-mode history row highlights */
-    .history-table tbody tr.log-ongoing {
-      background:#d1fae5;
-    }
-    .history-table tbody tr.log-ended {
-      background:#fee2e2;
-    }
-
-    /* darker, glowing rows in dark theme for better sync with top table */
-    html[data-theme="dark"] .history-table tbody tr.log-ongoing {
-      background: rgba(16,185,129,0.28);
-    }
-    html[data-theme="dark"] .history-table tbody tr.log-ended {
-      background: rgba(248,113,113,0.30);
-    }
-
-    @media (max-width: 820px) {
-      .container { padding:14px; width:100vw; }
-      table { font-size:12px; }
-      th, td { padding:6px; }
-      input[type="text"] { max-width:80px; }
-      input[type="datetime-local"] { max-width:140px; }
-    }
-  </style>
-
-  <!-- Theme + auto refresh -->
-  <script>
-    (function(){
-      const saved = localStorage.getItem('dashboard_theme');
-      if (saved) {
-        document.documentElement.setAttribute('data-theme', saved);
-      } else {
-        const prefersDark = window.matchMedia && window.matchMedia('(prefers-color-scheme: dark)').matches;
-        document.documentElement.setAttribute('data-theme', prefersDark ? 'dark' : 'light');
-      }
-    })();
-
-    function toggleTheme() {
-      const cur = document.documentElement.getAttribute('data-theme') || 'light';
-      const next = cur === 'dark' ? 'light' : 'dark';
-      document.documentElement.setAttribute('data-theme', next);
-      localStorage.setItem('dashboard_theme', next);
-      const btn = document.getElementById('themeToggleBtn');
-      if (btn) btn.textContent = next === 'dark' ? 'Dark' : 'Light';
-    }
-
-    let refreshInterval = null;
-    function startAutoRefresh() {
-      if (refreshInterval) return;
-      refreshInterval = setInterval(() => { window.location.reload(); }, {{ refresh_ms }});
-    }
-    function stopAutoRefresh() {
-      if (!refreshInterval) return;
-      clearInterval(refreshInterval);
-      return refreshInterval = null;
-    }
-  </script>
-
-  <!-- Datetime limits + AM/PM label -->
-  <script>
-    function formatAMPM(date) {
-      const pad = n => (n < 10 ? '0' + n : n);
-      let hours = date.getHours();
-      const minutes = pad(date.getMinutes());
-      const ampm = hours >= 12 ? 'PM' : 'AM';
-      hours = hours % 12;
-      if (hours === 0) hours = 12;
-      return hours + ':' + minutes + ' ' + ampm;
-    }
-
-    function updateTimeLabelForInput(inp) {
-      let label = inp.nextElementSibling;
-      if (!label || !label.classList || !label.classList.contains('time-display')) {
-        label = document.createElement('span');
-        label.className = 'time-display';
-        inp.parentNode.insertBefore(label, inp.nextSibling);
-      }
-      if (inp.value) {
-        const d = new Date(inp.value);
-        if (!isNaN(d.getTime())) label.textContent = formatAMPM(d);
-        else label.textContent = '';
-      } else {
-        label.textContent = '';
-      }
-    }
-
-    function setDateTimeLimits() {
-      const inputs = document.querySelectorAll('input[type="datetime-local"]');
-      if (!inputs.length) return;
-
-      const now = new Date();
-      now.setSeconds(0,0);
-      const max = new Date(now.getTime() + 30 * 24 * 60 * 60 * 1000);
-      function fmtLocal(d) {
-        const pad = n => n < 10 ? '0'+n : n;
-        return d.getFullYear() + '-' + pad(d.getMonth()+1) + '-' + pad(d.getDate()) + 'T' + pad(d.getHours()) + ':' + pad(d.getMinutes());
-      }
-      const minStr = fmtLocal(now);
-      const maxStr = fmtLocal(max);
-
-      inputs.forEach(inp => {
-        inp.setAttribute('min', minStr);
-        inp.setAttribute('max', maxStr);
-        inp.setAttribute('step', '60');
-        if (!inp.value) inp.value = minStr;
-        updateTimeLabelForInput(inp);
-        inp.addEventListener('input', function(){ updateTimeLabelForInput(inp); });
-      });
-    }
-  </script>
-
-  <!-- Main JS: modals, CRUD, theme button, host controls -->
-  <script>
-    document.addEventListener('DOMContentLoaded', function () {
-      setDateTimeLimits();
-      startAutoRefresh();
-
-      const confirmModal = document.getElementById('confirmModal');
-      const modalTitle = document.getElementById('modalTitle');
-      const modalMessage = document.getElementById('modalMessage');
-      const modalYes = document.getElementById('modalYes');
-      const modalNo = document.getElementById('modalNo');
-
-      const deviceModal = document.getElementById('deviceModal');
-      const deviceForm = document.getElementById('deviceForm');
-      const deviceNameInput = document.getElementById('deviceName');
-      const deviceActionInput = document.getElementById('deviceAction');
-      const deviceIdInput = document.getElementById('deviceId');
-      const deviceClose = document.getElementById('deviceClose');
-      const addDeviceBtn = document.getElementById('addDeviceBtn');
-      const recoverBtn = document.getElementById('recoverBtn');
-
-      const deleteModal = document.getElementById('deleteModal');
-      const deleteYes = document.getElementById('deleteYes');
-      const deleteNo = document.getElementById('deleteNo');
-      let deleteTargetId = null;
-
-      let pendingUnlockForm = null;
-
-      function openConfirm(title, message, onYes) {
-        modalTitle.textContent = title;
-        modalMessage.textContent = message;
-        confirmModal.style.display = 'flex';
-        stopAutoRefresh();
-        modalYes.onclick = function(){ confirmModal.style.display='none'; startAutoRefresh(); onYes && onYes(); };
-        modalNo.onclick = function(){ confirmModal.style.display='none'; startAutoRefresh(); };
-      }
-
-      function showDeviceModal(action, id, name) {
-        deviceActionInput.value = action;
-        deviceIdInput.value = id || '';
-        deviceNameInput.value = name || '';
-        deviceModal.style.display = 'flex';
-        stopAutoRefresh();
-        deviceNameInput.focus();
-      }
-      function closeDeviceModal() {
-        deviceModal.style.display = 'none';
-        startAutoRefresh();
-      }
-
-      function openDeleteConfirm(id, name) {
-        deleteTargetId = id;
-        document.getElementById('deleteMessage').textContent = `Delete "${name}"? This cannot be undone.`;
-        deleteModal.style.display = 'flex';
-        stopAutoRefresh();
-      }
-      function closeDeleteConfirm() {
-        deleteModal.style.display = 'none';
-        deleteTargetId = null;
-        startAutoRefresh();
-      }
-
-      if (addDeviceBtn) {
-        addDeviceBtn.addEventListener('click', function(){
-          showDeviceModal('add', '', '');
-        });
-      }
-
-      if (recoverBtn) {
-        recoverBtn.addEventListener('click', function(){
-          const f = document.createElement('form');
-          f.method = 'POST'; f.action = '{{ url_for("recover") }}';
-          document.body.appendChild(f); f.submit();
-        });
-      }
-
-      deviceClose.addEventListener('click', closeDeviceModal);
-
-      deviceForm.addEventListener('submit', function(e){
-        e.preventDefault();
-        const action = deviceActionInput.value;
-        const id = deviceIdInput.value;
-        const name = deviceNameInput.value.trim();
-        if (!name) return;
-        if (action === 'add') {
-          const f = document.createElement('form');
-          f.method = 'POST'; f.action = '{{ url_for("add_device") }}';
-          const ni = document.createElement('input'); ni.name = 'name'; ni.value = name; f.appendChild(ni);
-          document.body.appendChild(f); f.submit();
-        } else if (action === 'edit') {
-          const f = document.createElement('form');
-          f.method = 'POST'; f.action = '{{ url_for("edit_device", device_id=0) }}'.replace('0', id);
-          const ni = document.createElement('input'); ni.name = 'name'; ni.value = name; f.appendChild(ni);
-          document.body.appendChild(f); f.submit();
-        }
-      });
-
-      deleteYes.addEventListener('click', function(){
-        if (!deleteTargetId) return closeDeleteConfirm();
-        const f = document.createElement('form');
-        f.method = 'POST'; f.action = '{{ url_for("delete_device", device_id=0) }}'.replace('0', deleteTargetId);
-        document.body.appendChild(f); f.submit();
-      });
-      deleteNo.addEventListener('click', closeDeleteConfirm);
-
-      document.addEventListener('submit', function (ev) {
-        const form = ev.target;
-        if (form.classList && form.classList.contains('unlock-form')) {
-          ev.preventDefault();
-          const row = form.closest('tr');
-          pendingUnlockForm = form;
-          const deviceId = row.getAttribute('data-id') || '?';
-          const etaStatus = row.getAttribute('data-eta-status') || '';
-          if (etaStatus === 'Passed') {
-            openConfirm('ETA Passed — Confirm Unlock', `Device ${deviceId} has reached its ETA. Unlock now?`, function(){
-              pendingUnlockForm.submit();
-            });
-          } else {
-            openConfirm('Release Device', `Do you want to release Device ${deviceId}?`, function(){
-              pendingUnlockForm.submit();
-            });
-          }
-        }
-      });
-
-      document.addEventListener('click', function(e){
-        const el = e.target;
-        if (el.matches('[data-edit-id], [data-edit-id] *')) {
-          const btn = el.closest('[data-edit-id]');
-          const id = btn.getAttribute('data-edit-id');
-          const name = btn.getAttribute('data-edit-name') || '';
-          showDeviceModal('edit', id, name);
-          e.preventDefault();
-          return;
-        }
-        if (el.matches('[data-delete-id], [data-delete-id] *')) {
-          const btn = el.closest('[data-delete-id]');
-          const id = btn.getAttribute('data-delete-id');
-          const name = btn.getAttribute('data-delete-name') || '';
-          const row = btn.closest('tr');
-          const status = row ? row.getAttribute('data-status') : null;
-          if (status === 'In Use') {
-            alert('Cannot delete device while it is locked (In Use). Release/unlock first.');
-            e.preventDefault();
-            return;
-          }
-          openDeleteConfirm(id, name);
-          e.preventDefault();
-          return;
-        }
-        if (el.id === 'themeToggleBtn' || (el.closest && el.closest('#themeToggleBtn'))) {
-          toggleTheme();
-        }
-      });
-
-      [deviceModal, confirmModal, deleteModal].forEach(md => {
-        md.addEventListener('click', function(ev){
-          if (ev.target === md) {
-            md.style.display = 'none';
-            startAutoRefresh();
-          }
-        });
-      });
-
-      document.addEventListener('keydown', function(e){
-        if (e.key === 'Escape') {
-          [deviceModal, confirmModal, deleteModal].forEach(md => { if (md.style.display === 'flex') md.style.display = 'none'; });
-          startAutoRefresh();
-        }
-      });
-
-      const rows = document.querySelectorAll('tbody tr');
-      rows.forEach(r => {
-        r.addEventListener('touchstart', function () {
-          rows.forEach(rr => rr.classList.remove('row-popped'));
-          r.classList.add('row-popped');
-        }, {passive:true});
-        r.addEventListener('touchend', function () {
-          setTimeout(() => r.classList.remove('row-popped'), 700);
-        });
-      });
-
-      const tableWrapper = document.querySelector('.table-wrapper');
-      if (tableWrapper) {
-        tableWrapper.addEventListener('scroll', function () {
-          rows.forEach(rr => rr.classList.remove('row-popped'));
-        }, {passive:true});
-      }
-
-      const tbtn = document.getElementById('themeToggleBtn');
-      if (tbtn) {
-        const cur = document.documentElement.getAttribute('data-theme') || 'light';
-        tbtn.textContent = cur === 'dark' ? 'Dark' : 'Light';
-      }
-    });
-  </script>
-
-</head>
-<body>
-  <div class="container">
-    <div class="header">
-      <div>
-        <h2>Device Availability</h2>
-        <div class="subtitle">Green = Available, Red = In Use</div>
-      </div>
-
-      <div class="controls">
-        <button id="addDeviceBtn" class="btn-action">ADD DEVICE</button>
-        {% if is_host %}
-        <button id="recoverBtn" class="btn-action" title="Recover missing devices">RECOVER ID</button>
-        {% endif %}
-        <button id="themeToggleBtn" class="btn-action" title="Toggle theme">Theme</button>
-      </div>
-    </div>
-
-    <!-- DEVICE TABLE -->
-    <div class="table-wrapper" role="region" aria-label="Device list">
-      <table>
-        <thead>
-          <tr>
-            <th style="width:48px">ID</th>
-            <th>Device Name</th>
-            <th>Status</th>
-            <th>Current User</th>
-            <th>ETA</th>
-            <th>ETA Status</th>
-            <th>Actions</th>
-          </tr>
-        </thead>
-        <tbody>
-          {% for d in devices %}
-          <tr
-            data-id="{{ d['id'] }}"
-            data-status="{{ d['status'] }}"
-            data-user="{{ d['current_user'] or '' }}"
-            data-eta="{{ d['eta'] or '' }}"
-            data-eta-status="{{ d.get('eta_status','') }}"
-            class="status-{{ d['status']|lower|replace(' ', '') }}">
-            <td>{{ d['id'] }}</td>
-            <td>{{ d['name'] }}</td>
-            <td><span class="tag">{{ d['status'] }}</span></td>
-            <td class="user-name-display">{{ d['current_user'] or '-' }}</td>
-            <td>{{ d['eta_display'] }}</td>
-            <td>
-              {% if d.get('eta_status') == 'Passed' %}
-                <span class="eta-badge eta-passed">PASSED</span>
-              {% elif d.get('eta_status') == 'Active' %}
-                <span class="eta-badge eta-active">ACTIVE</span>
-              {% else %}
-                <span class="eta-badge eta-none">-</span>
-              {% endif %}
-            </td>
-            <td>
-              <div class="action-group">
-                {% if d['status'] == 'Available' %}
-                  <form class="inline" method="post" action="{{ url_for('lock_device', device_id=d['id']) }}">
-                    <input type="text" name="user" placeholder="Your name" required>
-                    <input class="eta-input" type="datetime-local" name="eta" required>
-                    <button type="submit" class="btn btn-lock">Lock</button>
-                  </form>
-                {% else %}
-                  <form class="unlock-form inline" method="post" action="{{ url_for('unlock_device', device_id=d['id']) }}">
-                    <button type="submit" class="btn btn-unlock">Unlock</button>
-                  </form>
-                {% endif %}
-
-                {% if is_host %}
-                  <button class="btn btn-edit btn-small" data-edit-id="{{ d['id'] }}" data-edit-name="{{ d['name'] }}">Edit</button>
-                  <button class="btn btn-delete btn-small" data-delete-id="{{ d['id'] }}" data-delete-name="{{ d['name'] }}">Delete</button>
-                {% endif %}
-              </div>
-            </td>
-          </tr>
-          {% endfor %}
-        </tbody>
-      </table>
-    </div>
-
-    <!-- USAGE HISTORY -->
-    <div class="history-section">
-      <div class="history-header-row">
-        <div>
-          <h3 class="history-title">Recent Usage History</h3>
-          <div class="history-note">Green = Ongoing (still using), Red = Completed usage</div>
-        </div>
-
-        <form class="download-form" method="get" action="{{ url_for('download_logs') }}">
-          <label>
-            From
-            <input type="date" name="start_date" max="{{ today }}">
-          </label>
-          <label>
-            To
-            <input type="date" name="end_date" max="{{ today }}">
-          </label>
-          <button type="submit" class="btn-download">Download Logs</button>
-        </form>
-      </div>
-
-      <div class="history-table-wrapper" role="region" aria-label="Usage history">
-        <table class="history-table">
-          <thead>
-            <tr>
-              <th style="width:48px">ID</th>
-              <th>Device Name</th>
-              <th>User</th>
-              <th>From</th>
-              <th>To</th>
-              <th>Duration</th>
-            </tr>
-          </thead>
-          <tbody>
-            {% if logs %}
-              {% for log in logs %}
-              <tr class="{% if log['is_ongoing'] %}log-ongoing{% else %}log-ended{% endif %}">
-                <td>{{ log['device_id'] }}</td>
-                <td>{{ log['device_name'] }}</td>
-                <td>{{ log['user'] }}</td>
-                <td>{{ log['start_display'] }}</td>
-                <td>{{ log['end_display'] }}</td>
-                <td>{{ log['duration'] }}</td>
-              </tr>
-              {% endfor %}
-            {% else %}
-              <tr>
-                <td colspan="6">No usage history yet. Lock a device to start logging.</td>
-              </tr>
-            {% endif %}
-          </tbody>
-        </table>
-      </div>
-    </div>
-
-  </div>
-
-  <!-- Confirm modal -->
-  <div id="confirmModal" class="modal-backdrop" aria-hidden="true" role="dialog" aria-modal="true">
-    <div class="modal" role="document">
-      <h3 id="modalTitle">Confirm</h3>
-      <p id="modalMessage">Are you sure?</p>
-      <div class="actions">
-        <button id="modalYes" class="btn-yes">Yes</button>
-        <button id="modalNo" class="btn-no">No</button>
-      </div>
-    </div>
-  </div>
-
-  <!-- Device modal -->
-  <div id="deviceModal" class="modal-backdrop" style="display:none;">
-    <div class="modal">
-      <h3 id="deviceModalTitle">Device</h3>
-      <form id="deviceForm">
-        <input type="hidden" id="deviceAction" name="action" value="add">
-        <input type="hidden" id="deviceId" name="device_id" value="">
-        <input type="text" id="deviceName" name="name" placeholder="Device name" required>
-        <div class="actions">
-          <button type="submit" class="btn-yes">Save</button>
-          <button type="button" id="deviceClose" class="btn-no">Cancel</button>
-        </div>
-      </form>
-    </div>
-  </div>
-
-  <!-- Delete confirm -->
-  <div id="deleteModal" class="modal-backdrop" style="display:none;">
-    <div class="modal">
-      <h3>Delete Device</h3>
-      <p id="deleteMessage">Are you sure?</p>
-      <div class="actions">
-        <button id="deleteYes" class="btn-yes">Delete</button>
-        <button id="deleteNo" class="btn-no">Cancel</button>
-      </div>
-    </div>
-  </div>
-
-</body>
-</html>
-"""
-
-# ---------- DB helpers ----------
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    create = not os.path.exists(DB_PATH)
-    conn = get_db()
-    if create:
-        conn.execute("""
-            CREATE TABLE devices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'Available',
-                current_user TEXT,
-                eta TEXT
-            )
-        """)
-        for i in range(1, 16):
-            conn.execute("INSERT INTO devices (name) VALUES (?)", (f"Device {i}",))
-        conn.commit()
-
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id INTEGER NOT NULL,
-            user TEXT NOT NULL,
-            start_time TEXT NOT NULL,
-            end_time TEXT,
-            FOREIGN KEY(device_id) REFERENCES devices(id)
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-    export_logs_to_file()
-
-def find_smallest_missing_id(conn):
-    cur = conn.execute("SELECT id FROM devices ORDER BY id")
-    rows = cur.fetchall()
-    expect = 1
-    for r in rows:
-        try:
-            i = int(r["id"])
-        except Exception:
-            continue
-        if i == expect:
-            expect += 1
-        elif i > expect:
-            return expect
-    return expect
-
-def get_max_id(conn):
-    cur = conn.execute("SELECT MAX(id) as m FROM devices")
-    r = cur.fetchone()
-    return r["m"] or 0
-
-# ---------- routes ----------
-@app.route("/")
-def index():
-    conn = get_db()
-    cur = conn.execute("SELECT id, name, status, current_user, eta FROM devices ORDER BY id")
-    rows = cur.fetchall()
-
-    log_rows = conn.execute("""
-        SELECT l.id, l.device_id, d.name AS device_name,
-               l.user, l.start_time, l.end_time
-        FROM logs l
-        JOIN devices d ON d.id = l.device_id
-        ORDER BY l.id DESC
-        LIMIT 50
-    """).fetchall()
-    conn.close()
-
-    devices = []
-    now = datetime.now()
-    for r in rows:
-        d = dict(r)
-        eta_status = ''
-        if d['status'] == 'In Use' and d.get('eta'):
-            try:
-                eta_dt = datetime.fromisoformat(d['eta'])
-                eta_status = 'Passed' if eta_dt <= now else 'Active'
-            except Exception:
-                eta_status = ''
-        d['eta_status'] = eta_status
-        d['eta_display'] = format_eta_display(d['eta']) if d.get('eta') else '-'
-        devices.append(d)
-
-    logs = []
-    for r in log_rows:
-        l = dict(r)
-        l['start_display'] = format_eta_display(l['start_time'])
-        if l.get('end_time'):
-            l['end_display'] = format_eta_display(l['end_time'])
-            l['duration'] = compute_duration(l['start_time'], l['end_time'])
-            l['is_ongoing'] = False
-        else:
-            l['end_display'] = "Ongoing"
-            l['duration'] = "-"
-            l['is_ongoing'] = True
-        logs.append(l)
-
-    today = datetime.now().date().isoformat()
-    host_flag = is_request_from_host()
-    return render_template_string(
-        TEMPLATE,
-        devices=devices,
-        logs=logs,
-        refresh_ms=REFRESH_MS,
-        today=today,
-        is_host=host_flag
-    )
-
-@app.route("/lock/<int:device_id>", methods=["POST"])
-def lock_device(device_id):
-    user = request.form.get('user', '').strip().upper()
-    eta = request.form.get('eta', '').strip()
-    if not user or not eta:
-        return redirect(url_for('index'))
-
-    try:
-        eta_dt = datetime.fromisoformat(eta)
-    except Exception:
-        return redirect(url_for('index'))
-    now = datetime.now()
-    max_allowed = now + timedelta(days=30)
-    if eta_dt < now or eta_dt > max_allowed:
-        return redirect(url_for('index'))
-
-    conn = get_db()
-    conn.execute("UPDATE devices SET status='In Use', current_user=?, eta=? WHERE id=?",
-                 (user, eta, device_id))
-    conn.execute(
-        "INSERT INTO logs (device_id, user, start_time) VALUES (?, ?, ?)",
-        (device_id, user, now.isoformat(timespec='minutes'))
-    )
-    conn.commit()
-    conn.close()
-
-    export_logs_to_file()
-    return redirect(url_for('index'))
-
-@app.route("/unlock/<int:device_id>", methods=["POST"])
-def unlock_device(device_id):
-    now = datetime.now()
-    conn = get_db()
-    conn.execute("UPDATE devices SET status='Available', current_user=NULL, eta=NULL WHERE id=?",
-                 (device_id,))
-    conn.execute("""
-        UPDATE logs
-        SET end_time = ?
-        WHERE id = (
-            SELECT id FROM logs
-            WHERE device_id = ? AND end_time IS NULL
-            ORDER BY id DESC
-            LIMIT 1
-        )
-    """, (now.isoformat(timespec='minutes'), device_id))
-    conn.commit()
-    conn.close()
-
-    export_logs_to_file()
-    return redirect(url_for('index'))
-
-@app.route("/add", methods=["POST"])
-def add_device():
-    name = request.form.get('name', '').strip()
-    if not name:
-        return redirect(url_for('index'))
-
-    conn = get_db()
-    try:
-        conn.execute("BEGIN IMMEDIATE")
-        new_id = find_smallest_missing_id(conn)
-        conn.execute("INSERT OR IGNORE INTO devices (id, name) VALUES (?, ?)", (new_id, name))
-        cur = conn.execute("SELECT 1 FROM devices WHERE id=?", (new_id,))
-        if not cur.fetchone():
-            conn.execute("INSERT INTO devices (name) VALUES (?)", (name,))
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        try:
-            conn.execute("INSERT INTO devices (name) VALUES (?)", (name,))
-            conn.commit()
-        except Exception:
-            conn.rollback()
-    finally:
-        conn.close()
-    return redirect(url_for('index'))
-
-@app.route("/edit/<int:device_id>", methods=["POST"])
-def edit_device(device_id):
-    if not is_request_from_host():
-        return redirect(url_for('index'))
-    name = request.form.get('name', '').strip()
-    if not name:
-        return redirect(url_for('index'))
-    conn = get_db()
-    conn.execute("UPDATE devices SET name=? WHERE id=?", (name, device_id))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('index'))
-
-@app.route("/delete/<int:device_id>", methods=["POST"])
-def delete_device(device_id):
-    if not is_request_from_host():
-        return redirect(url_for('index'))
-    conn = get_db()
-    cur = conn.execute("SELECT status FROM devices WHERE id=?", (device_id,))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
-        return redirect(url_for('index'))
-    if row["status"] == "In Use":
-        conn.close()
-        return redirect(url_for('index'))
-    conn.execute("DELETE FROM devices WHERE id=?", (device_id,))
-    conn.commit()
-    conn.close()
-    export_logs_to_file()
-    return redirect(url_for('index'))
-
-@app.route("/recover", methods=["POST"])
-def recover():
-    if not is_request_from_host():
-        return redirect(url_for('index'))
-    conn = get_db()
-    try:
-        conn.execute("BEGIN IMMEDIATE")
-        max_id = get_max_id(conn)
-        if max_id < 1:
-            conn.execute("INSERT INTO devices (id, name, status) VALUES (?, ?, ?)", (1, "Device 1", "Available"))
-            conn.commit()
-            conn.close()
-            return redirect(url_for('index'))
-        cur = conn.execute("SELECT id FROM devices")
-        present = set(r["id"] for r in cur.fetchall())
-        missing = [i for i in range(1, max_id+1) if i not in present]
-        for mid in missing:
-            conn.execute(
-                "INSERT OR IGNORE INTO devices (id, name, status) VALUES (?, ?, ?)",
-                (mid, f"Device {mid}", "Available")
-            )
-        conn.commit()
-    except Exception:
-        conn.rollback()
-    finally:
-        conn.close()
-    return redirect(url_for('index'))
-
-@app.route("/download_logs")
-def download_logs():
-    start_date = request.args.get("start_date", "").strip()
-    end_date = request.args.get("end_date", "").strip()
-
-    conn = get_db()
-    sql = """
-        SELECT l.id,
-               l.device_id,
-               d.name AS device_name,
-               l.user,
-               l.start_time,
-               l.end_time
-        FROM logs l
-        JOIN devices d ON d.id = l.device_id
-    """
-    where = []
-    params = []
-    if start_date:
-        where.append("date(l.start_time) >= date(?)")
-        params.append(start_date)
-    if end_date:
-        where.append("date(l.start_time) <= date(?)")
-        params.append(end_date)
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY date(l.start_time) ASC, l.start_time ASC, l.id ASC"
-
-    rows = conn.execute(sql, params).fetchall()
-    conn.close()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["date", "serial", "device_id", "device_name", "user", "start_time", "end_time", "duration", "status"])
-
-    current_date = None
-    serial = 0
-    for r in rows:
-        start_str = r["start_time"]
-        end_str = r["end_time"]
-
-        try:
-            st_dt = datetime.fromisoformat(start_str)
-            date_str = st_dt.strftime("%Y-%m-%d")
-            start_time_str = st_dt.strftime("%H:%M")
-        except Exception:
-            date_str = ""
-            start_time_str = ""
-
-        if end_str:
-            try:
-                et_dt = datetime.fromisoformat(end_str)
-                end_time_str = et_dt.strftime("%H:%M")
-            except Exception:
-                end_time_str = ""
-            status = "Completed"
-        else:
-            end_time_str = ""
-            status = "Ongoing"
-
-        duration = compute_duration(start_str, end_str)
-
-        if date_str != current_date:
-            if current_date is not None:
-                writer.writerow([])
-            current_date = date_str
-            serial = 1
-        else:
-            serial += 1
-
-        writer.writerow([
-            date_str,
-            serial,
-            r["device_id"],
-            r["device_name"],
-            r["user"],
-            start_time_str,
-            end_time_str,
-            duration,
-            status
-        ])
-
-    csv_data = output.getvalue()
-    output.close()
-
-    if start_date or end_date:
-        fn_start = start_date or "start"
-        fn_end = end_date or "end"
-        filename = f"logs_{fn_start}_to_{fn_end}.csv"
-    else:
-        filename = "logs_all.csv"
-
-    response = make_response(csv_data)
-    response.headers["Content-Type"] = "text/csv; charset=utf-8"
-    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
-    return response
-
-# ---------- start ----------
-if __name__ == "__main__":
-    try:
-        init_db()
-        print("Starting server at http://127.0.0.1:5000")
-        print("Allowed hosts:", ALLOWED_HOST_IPS)
-        app.run(host="0.0.0.0", port=5000, debug=True)
-    except Exception as e:
-        print("Failed to start:", e)
-        traceback.print_exc()
-        sys.exit(1)
+# app.py - Vamsy + ChatGPT full merged version (dark history fixed)
+from flask import Flask, Response, jsonify, request, redirect, url_for, make_response, send_file
+from markupsafe import escape
+from werkzeug.serving import make_server
+from werkzeug.wsgi import FileWrapper
+import sqlite3, os, socket, traceback, sys, csv, io, json, threading, queue, time, atexit, functools, hashlib, argparse, heapq
+import gzip, itertools, zlib, uuid, asyncio, multiprocessing, signal, random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+try:
+    import pyarrow as pa  # optional: only /download_logs?format=arrow needs it
+except ImportError:
+    pa = None
+try:
+    import uvicorn  # optional: only the serve-async command needs it
+except ImportError:
+    uvicorn = None
+
+DB_PATH = "devices.db"
+LOG_FILE = "logs.csv"
+REFRESH_MS = 30000  # 30 seconds
+BATCH_MAX_DEVICES = 200  # devices per /api/batch lock or unlock
+IMPORT_MAX_ROWS = 50000  # devices accepted by one bulk import
+ASSET_MAX_AGE = 365 * 24 * 3600  # hashed /assets files are immutable
+HISTORY_LIMIT = 50  # rows per page of the "Recent Usage History" table
+DEVICE_PAGE_SIZE = 50  # device rows per dashboard page
+DEVICE_PAGE_MAX = 500
+DEVICE_VIEW_CACHE_MAX = 64  # distinct filter/sort/page views kept by the render cache
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000  # browser reconnect delay after the event stream drops
+SSE_QUEUE_SIZE = 256  # pending events per subscriber before it is dropped
+API_LOGS_MAX = 500
+DB_POOL_SIZE = 8  # idle connections kept open between requests
+DB_BUSY_TIMEOUT_MS = 5000
+DB_STATEMENT_CACHE = 256  # prepared statements cached per connection
+DOWNLOAD_CHUNK_ROWS = 1000  # rows fetched and flushed per streamed download chunk
+ARROW_BATCH_CHUNKS = 64  # download chunks per Arrow record batch (columns compress better when long)
+EXPORT_CACHE_DIR = "export_cache"  # finished background exports, reused until their range changes
+EXPORT_CACHE_MAX_FILES = 32
+EXPORT_JOB_WORKERS = 2
+ASGI_WORKER_THREADS = 32  # threads running Flask views for asgi_app; idle /events streams hold none
+ASGI_FILE_BLOCK = 256 * 1024  # bytes per executor hop when asgi_app sends a cached export file
+BACKFILL_BATCH_ROWS = 5000  # log rows converted per write transaction by migrations
+BACKFILL_PAUSE_SECONDS = 0.05
+EXPORT_FLUSH_SECONDS = 2.0  # lock/unlock bursts within this window share one logs.csv sync
+RESERVATION_HORIZON_DAYS = 30  # how far ahead a booking may end, same window as lock ETAs
+LOG_ARCHIVE_DIR = "logs_archive"  # cold storage: gzipped NDJSON segments per start month
+LOG_ARCHIVE_AFTER_DAYS = 180  # completed sessions that ended longer ago than this leave the hot table
+SERVER_WORKERS = os.cpu_count() or 2  # HTTP worker processes started by the serve command
+WORKER_POLL_SECONDS = 0.1  # how often forked processes pick up each other's events and state changes
+EVENT_LOG_KEEP = 1000  # rows of the shared events table kept for workers that are catching up
+DB_BUSY_RETRIES = 4  # extra attempts for a write route that still got SQLITE_BUSY after busy_timeout
+DB_BUSY_BACKOFF_SECONDS = 0.05
+EXPORT_PROGRESS_SECONDS = 0.5  # export job progress is written for other workers at most this often
+app = Flask(__name__)
+
+# ---------- discover host IPs (for owner-only actions) ----------
+def discover_local_ips():
+    ips = set(["127.0.0.1", "::1"])
+    try:
+        hn_ip = socket.gethostbyname(socket.gethostname())
+        if hn_ip:
+            ips.add(hn_ip)
+    except Exception:
+        pass
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ips.add(s.getsockname()[0])
+        s.close()
+    except Exception:
+        pass
+    return ips
+
+ALLOWED_HOST_IPS = discover_local_ips()
+print("Allowed host IPs:", ALLOWED_HOST_IPS)
+
+def is_request_from_host():
+    ip = request.remote_addr
+    return ip in ALLOWED_HOST_IPS
+
+# ---------- helper formatting ----------
+def format_eta_display(eta_str):
+    try:
+        dt = datetime.fromisoformat(eta_str)
+        return dt.strftime("%d-%m-%Y %I:%M %p")
+    except Exception:
+        return eta_str or "-"
+
+def epoch_minutes(dt):
+    """epoch seconds of a naive local datetime, truncated to the minute like the stored ISO text"""
+    return int(dt.replace(second=0, microsecond=0).timestamp())
+
+# ---------- export logs to CSV (per-day serial + partition rows) ----------
+LOG_HEADER = ["date", "serial", "device_id", "device_name",
+              "user", "start_time", "end_time", "duration", "status"]
+LOG_STATE_FILE = LOG_FILE + ".state"
+_export_lock = threading.Lock()
+
+# session length from the epoch columns; rows the background backfill hasn't
+# reached yet fall back to converting the ISO text in SQL
+LOG_MINUTES_SQL = """
+    (COALESCE(l.end_ts, CAST(strftime('%s', l.end_time, 'utc') AS INTEGER))
+     - COALESCE(l.start_ts, CAST(strftime('%s', l.start_time, 'utc') AS INTEGER))) / 60
+"""
+
+# start_time / end_time are written with isoformat(timespec='minutes'), so the
+# day / HH:MM split and the duration are plain string + integer work in SQL
+LOG_EXPORT_SELECT = f"""
+    SELECT l.id,
+           l.device_id,
+           d.name AS device_name,
+           l.user,
+           l.start_time,
+           l.end_time,
+           substr(l.start_time, 1, 10) AS day,
+           substr(l.start_time, 12, 5) AS start_hm,
+           substr(l.end_time, 12, 5) AS end_hm,
+           {LOG_MINUTES_SQL} AS minutes
+    FROM logs l
+    JOIN devices d ON d.id = l.device_id
+"""
+
+@functools.lru_cache(maxsize=4096)
+def format_minutes(total_minutes):
+    """'2h 10m' / '15m' / '-' for a whole number of minutes (None = unknown)"""
+    if total_minutes is None or total_minutes < 0:
+        return "-"
+    hours, minutes = divmod(total_minutes, 60)
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+def log_csv_fields(r, serial):
+    """one LOG_EXPORT_SELECT row as a CSV record"""
+    if r["end_time"]:
+        return [r["day"], serial, r["device_id"], r["device_name"], r["user"],
+                r["start_hm"], r["end_hm"], format_minutes(r["minutes"]), "Completed"]
+    return [r["day"], serial, r["device_id"], r["device_name"], r["user"],
+            r["start_hm"], "", "-", "Ongoing"]
+
+def iter_log_csv(rows, state):
+    """
+    Shared row pipeline for logs.csv and /download_logs: yields (row, fields)
+    per log row in start_time order, plus (None, []) partition rows between
+    days. state["last_date"] / state["serial"] carry the day group across calls.
+    """
+    last_date = state["last_date"]
+    serial = state["serial"]
+    for r in rows:
+        day = r["day"]
+        # new date group
+        if day != last_date:
+            if last_date is not None:
+                yield None, []  # partition row
+            last_date = day
+            serial = 1
+        else:
+            serial += 1
+        state["last_date"] = last_date
+        state["serial"] = serial
+        yield r, log_csv_fields(r, serial)
+
+def csv_line(fields):
+    buf = io.StringIO()
+    csv.writer(buf).writerow(fields)
+    return buf.getvalue().encode("utf-8")
+
+def _append_log_rows(f, state, rows):
+    """
+    append rows at the current position of f, continuing state's date group /
+    serial; returns the number of log rows written
+    """
+    count = 0
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    pos = f.tell()
+    chunk = []
+    for r, fields in iter_log_csv(rows, state):
+        writer.writerow(fields)
+        line = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+        if r is not None:
+            count += 1
+            if not r["end_time"]:
+                # remember where ongoing rows live so they can be patched when they end
+                state["open"][str(r["id"])] = [pos, len(line), state["serial"]]
+            state["last_log_id"] = max(state["last_log_id"], r["id"])
+        chunk.append(line)
+        pos += len(line)
+        if len(chunk) >= DOWNLOAD_CHUNK_ROWS:
+            f.write(b"".join(chunk))
+            chunk = []
+    f.write(b"".join(chunk))
+    return count
+
+def _patch_log_rows(f, state, ended):
+    """rewrite the rows of sessions that just ended; only the file tail after the first one moves"""
+    patches = []
+    for r in ended:
+        offset, length, serial = state["open"].pop(str(r["id"]))
+        patches.append((offset, length, csv_line(log_csv_fields(r, serial))))
+    patches.sort(key=lambda p: p[0])
+
+    start = patches[0][0]
+    f.seek(start)
+    tail = f.read()
+    out = []
+    pos = start
+    shifts = []
+    for offset, length, line in patches:
+        out.append(tail[pos - start:offset - start])
+        out.append(line)
+        pos = offset + length
+        shifts.append((offset, len(line) - length))
+    out.append(tail[pos - start:])
+    f.seek(start)
+    f.write(b"".join(out))
+    f.truncate()
+
+    # rows still open after a patched row moved by the accumulated size difference
+    for entry in state["open"].values():
+        entry[0] += sum(delta for offset, delta in shifts if offset < entry[0])
+
+def _load_export_state():
+    try:
+        with open(LOG_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if os.path.getsize(LOG_FILE) != state["size"]:
+            return None
+        return state
+    except Exception:
+        return None
+
+def _save_export_state(state):
+    tmp = LOG_STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, LOG_STATE_FILE)
+
+def _rebuild_log_file():
+    conn = get_db()
+    hi = conn.execute("SELECT COALESCE(MAX(id), 0) AS m FROM logs").fetchone()["m"]
+    cur = conn.execute(
+        LOG_EXPORT_SELECT
+        + " WHERE l.id <= ? ORDER BY l.start_time ASC, l.id ASC",
+        (hi,)
+    )
+    state = {"size": 0, "last_log_id": hi, "last_date": None, "serial": 0, "open": {}}
+    tmp = LOG_FILE + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(csv_line(LOG_HEADER))
+            count = _append_log_rows(f, state, merge_archived_logs(cur, "", ""))
+            state["size"] = f.tell()
+    finally:
+        cur.close()
+        conn.close()
+    os.replace(tmp, LOG_FILE)
+    _save_export_state(state)
+    return count
+
+def export_logs_to_file():
+    """
+    Full rebuild: rewrites LOG_FILE as CSV with:
+      date, serial (resets each day), device_id, device_name, user,
+      start_time, end_time, duration, status
+    and blank row between days.
+    This is O(total history) - routes schedule incremental syncs via request_log_export().
+    """
+    try:
+        with _export_lock:
+            count = _rebuild_log_file()
+        print(f"[LOG EXPORT] Logs written to {LOG_FILE} ({count} rows)")
+    except Exception as e:
+        print("[LOG EXPORT] Failed to export logs:", e)
+        traceback.print_exc()
+
+def sync_logs_to_file():
+    """
+    Incremental export: appends sessions newer than the last exported log id and
+    patches the rows of sessions that ended since the last sync. Falls back to a
+    full rebuild only when LOG_FILE / its state file are missing or out of step.
+    """
+    try:
+        with _export_lock:
+            state = _load_export_state()
+            if state is None:
+                count = _rebuild_log_file()
+                print(f"[LOG EXPORT] No usable export state, rebuilt {LOG_FILE} ({count} rows)")
+                return
+
+            conn = get_db()
+            hi = conn.execute("SELECT COALESCE(MAX(id), 0) AS m FROM logs").fetchone()["m"]
+            ended = []
+            open_ids = [int(k) for k in state["open"]]
+            if open_ids:
+                marks = ",".join("?" * len(open_ids))
+                current = conn.execute(
+                    LOG_EXPORT_SELECT + f" WHERE l.id IN ({marks})", open_ids
+                ).fetchall()
+                ended = [r for r in current if r["end_time"]]
+                # sessions whose log/device row disappeared stay as last written
+                seen = set(str(r["id"]) for r in current)
+                for k in list(state["open"]):
+                    if k not in seen:
+                        del state["open"][k]
+            new_rows = conn.execute(
+                LOG_EXPORT_SELECT
+                + " WHERE l.id > ? AND l.id <= ? ORDER BY l.start_time ASC, l.id ASC",
+                (state["last_log_id"], hi)
+            ).fetchall()
+            conn.close()
+
+            state["last_log_id"] = max(state["last_log_id"], hi)
+            if ended or new_rows:
+                with open(LOG_FILE, "r+b") as f:
+                    if ended:
+                        _patch_log_rows(f, state, ended)
+                    f.seek(0, os.SEEK_END)
+                    _append_log_rows(f, state, new_rows)
+                    state["size"] = f.tell()
+            _save_export_state(state)
+
+        if ended or new_rows:
+            print(f"[LOG EXPORT] {LOG_FILE}: appended {len(new_rows)}, closed {len(ended)}")
+    except Exception as e:
+        print("[LOG EXPORT] Failed to sync logs:", e)
+        traceback.print_exc()
+
+# ---------- background export writer ----------
+_export_queue = queue.Queue()
+_export_thread = None
+
+def _export_worker():
+    running = True
+    while running:
+        item = _export_queue.get()
+        if item is None:
+            break
+        rebuild = item == "rebuild"
+        # coalesce everything that arrives within the flush window into one sync
+        deadline = time.monotonic() + EXPORT_FLUSH_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _export_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            rebuild = rebuild or item == "rebuild"
+        # a pending rebuild rewrites everything a sync would have appended
+        if rebuild:
+            export_logs_to_file()
+        else:
+            sync_logs_to_file()
+
+def start_export_worker():
+    global _export_thread
+    if _export_thread is not None:
+        return
+    _export_thread = threading.Thread(target=_export_worker, name="log-export", daemon=True)
+    _export_thread.start()
+    atexit.register(stop_export_worker)
+
+def stop_export_worker():
+    """flush whatever is pending and stop the writer thread"""
+    global _export_thread
+    if _export_thread is None:
+        return
+    _export_queue.put(None)
+    _export_thread.join()
+    _export_thread = None
+
+# under serve, logs.csv has one writer: the housekeeper process. HTTP workers
+# don't touch the file; the housekeeper syncs whenever the shared state version moves
+_serving_worker = False  # True in a forked HTTP worker
+_log_rebuild_event = None  # multiprocessing.Event a worker sets to ask for a full rebuild
+
+def request_log_export():
+    """schedule a logs.csv sync; runs inline when the writer thread isn't started"""
+    if _serving_worker:
+        return
+    if _export_thread is None:
+        sync_logs_to_file()
+    else:
+        _export_queue.put(True)
+
+def request_log_rebuild(inline=False):
+    """schedule a full logs.csv rebuild; inline=True (the admin button) waits for it"""
+    if _serving_worker:
+        _log_rebuild_event.set()
+    elif inline or _export_thread is None:
+        export_logs_to_file()
+    else:
+        _export_queue.put("rebuild")
+
+# ---------- static assets (served content-hashed from /assets) ----------
+DASHBOARD_CSS = """/* ---------- theme variables ---------- */
+:root{
+  --bg: linear-gradient(135deg,#4285F4 0%,#EA4335 25%,#FBBC05 50%,#34A853 75%,#4285F4 100%);
+  --card-bg: rgba(255,255,255,0.96);
+  --text: #0f172a;
+  --muted: #475569;
+  --panel: #d1fae5;
+  --panel-red: #fee2e2;
+  --thead-bg: #0f172a;
+  --thead-color: #f8fafc;
+  --accent: #111827;
+  --shadow: rgba(0,0,0,0.35);
+  --button-bg: #111827;
+  --button-color: #fff;
+}
+
+html[data-theme="dark"]{
+  --bg: linear-gradient(135deg,#0f172a 0%, #0b3d91 40%, #07172a 100%);
+  --card-bg: rgba(6,10,24,0.92);
+  --text: #e6eef8;
+  --muted: #a8b3c6;
+  --panel: rgba(16,64,48,0.25);
+  --panel-red: rgba(139, 30, 40, 0.12);
+  --thead-bg: #071028;
+  --thead-color: #e6eef8;
+  --accent: #9cc3ff;
+  --shadow: rgba(0,0,0,0.7);
+  --button-bg: #e6eef8;
+  --button-color: #071028;
+}
+
+* { box-sizing: border-box; }
+body {
+  margin: 0;
+  font-family: system-ui, -apple-system, "Segoe UI", Roboto, "Helvetica Neue", Arial;
+  font-weight: 700;
+  background: var(--bg);
+  color: var(--text);
+  min-height: 100vh;
+  display: flex;
+  align-items: flex-start;
+  justify-content: center;
+  padding: 16px;
+}
+
+.container {
+  width: 95vw;
+  max-width: 2000px;
+  background: var(--card-bg);
+  border-radius: 26px;
+  padding: 28px 32px 32px;
+  box-shadow: 0 25px 45px var(--shadow);
+  backdrop-filter: blur(8px);
+  display: flex;
+  flex-direction: column;
+}
+
+.header { display:flex; justify-content:space-between; align-items:baseline; margin-bottom:12px; gap:12px; }
+h2 { margin:0; font-size:28px; color:var(--text); }
+.subtitle { font-size:12px; color:var(--muted); font-weight:700; }
+
+.controls { display:flex; gap:12px; align-items:center; }
+.btn-action {
+  padding:8px 14px; border-radius:999px; border:none; cursor:pointer; font-weight:800; text-transform:uppercase;
+  background:var(--button-bg); color:var(--button-color);
+  box-shadow: 0 6px 12px rgba(0,0,0,0.12);
+  font-size:12px;
+  white-space:nowrap;
+}
+
+.table-wrapper {
+  margin-top: 8px;
+  border-radius: 8px;
+}
+
+table { width:100%; border-collapse:collapse; font-size:14px; }
+thead th {
+  position: sticky; top:0;
+  background: var(--thead-bg); color: var(--thead-color); padding:12px 10px; text-align:left;
+  z-index:2; border-bottom:3px solid var(--thead-bg);
+}
+th, td { padding:8px 10px; vertical-align:middle; font-weight:700; }
+tbody tr { transition: transform 160ms cubic-bezier(.2,.9,.2,1), box-shadow 160ms cubic-bezier(.2,.9,.2,1); transform-origin:center; position:relative; z-index:0; }
+tbody tr:hover, tbody tr.row-popped, tbody tr:focus-within {
+  transform: translateY(-4px) scale(1.01);
+  box-shadow: 0 12px 22px rgba(15,23,42,0.12);
+  z-index:3;
+}
+
+.status-available { background: var(--panel); }
+.status-inuse, .status-maintenance { background: var(--panel-red); }
+
+.tag { display:inline-block; padding:3px 8px; border-radius:999px; font-size:10px; text-transform:uppercase; letter-spacing:.03em; }
+.status-available .tag { background:#16a34a; color:#052e16; }
+.status-inuse .tag { background:#ef4444; color:#fff; }
+
+.eta-badge { display:inline-block; padding:4px 8px; border-radius:999px; font-size:11px; font-weight:800; color:#fff; }
+.eta-active { background:#10b981; }
+.eta-passed { background:#ef4444; }
+.eta-none { background:#9ca3af; }
+
+.btn { padding:5px 10px; border-radius:999px; border:none; cursor:pointer; font-size:11px; font-weight:800; text-transform:uppercase; white-space:nowrap; }
+.btn-lock { background:#2563eb; color:#fff; }
+.btn-unlock { background:#16a34a; color:#fff; }
+.btn-edit { background:#f59e0b; color:#fff; }
+.btn-delete { background:#ef4444; color:#fff; }
+.btn-small { padding:4px 8px; font-size:10px; border-radius:8px; }
+
+form.inline {
+  display:inline-flex;
+  align-items:center;
+  gap:6px;
+  flex-wrap:nowrap;
+  white-space:nowrap;
+}
+
+input[type="text"], input[type="datetime-local"], input[type="date"] {
+  border-radius:999px; border:1px solid #d1d5db; padding:4px 8px; font-size:11px; font-weight:700;
+}
+input[type="text"] { max-width:110px; }
+input[type="datetime-local"] { background:#fff; max-width:170px; }
+
+html[data-theme="dark"] input[type="text"],
+html[data-theme="dark"] input[type="datetime-local"],
+html[data-theme="dark"] input[type="date"] {
+  background: rgba(255,255,255,0.03);
+  border-color: rgba(255,255,255,0.06);
+  color: var(--text);
+}
+
+.user-name-display {
+  text-transform: uppercase;
+  font-size: 14px;
+  font-weight: 900;
+  letter-spacing: 0.5px;
+  color: var(--text);
+}
+
+.action-group {
+  display:flex;
+  align-items:center;
+  gap:6px;
+  flex-wrap:nowrap;
+  white-space:nowrap;
+}
+
+/* modals */
+.modal-backdrop { position: fixed; inset: 0; background: rgba(0,0,0,0.45); display:none; align-items:center; justify-content:center; z-index:9999; }
+.modal { background:#fff; border-radius:12px; padding:18px; width:480px; max-width:96%; box-shadow: 0 12px 30px rgba(0,0,0,0.35); text-align:center; font-weight:700; }
+.modal h3 { margin:0 0 8px 0; font-size:18px; color:#0f172a; }
+.modal p { margin:0 0 16px 0; font-size:14px; color:#475569; font-weight:700; }
+.modal .actions { display:flex; gap:10px; justify-content:center; margin-top:12px; }
+.modal .actions button { padding:8px 14px; border-radius:999px; border:none; cursor:pointer; font-weight:800; text-transform:uppercase; font-size:12px; }
+.btn-yes { background:#16a34a; color:#fff; }
+.btn-no { background:#ef4444; color:#fff; }
+
+.modal form input[type="text"] { width:100%; border-radius:8px; padding:10px; font-weight:700; }
+
+.time-display { margin-left:8px; font-weight:800; font-size:11px; color:var(--text); }
+
+/* History section */
+.history-section { margin-top:22px; }
+.history-header-row {
+  display:flex;
+  justify-content:space-between;
+  align-items:center;
+  gap:12px;
+  flex-wrap:wrap;
+}
+.history-title { margin:0 0 4px 0; font-size:18px; color:var(--text); }
+.history-note { font-size:12px; color:var(--muted); font-weight:700; margin-bottom:4px; }
+
+.download-form {
+  display:flex;
+  align-items:center;
+  gap:8px;
+  flex-wrap:wrap;
+  font-size:11px;
+}
+.download-form label { display:flex; align-items:center; gap:4px; }
+.btn-download {
+  padding:6px 12px;
+  border-radius:999px;
+  border:none;
+  cursor:pointer;
+  font-size:11px;
+  font-weight:800;
+  text-transform:uppercase;
+  background:var(--button-bg);
+  color:var(--button-color);
+  box-shadow:0 4px 10px rgba(0,0,0,0.18);
+  white-space:nowrap;
+}
+
+.device-filter { display:flex; flex-wrap:wrap; gap:8px; align-items:center; margin-bottom:6px; }
+.download-status { font-size:11px; color:var(--muted); }
+.download-form select, .device-filter select {
+  border-radius:999px; border:1px solid #d1d5db; padding:4px 8px; font-size:11px; font-weight:700;
+}
+.btn-filter, .btn-page { background:var(--button-bg); color:var(--button-color); text-decoration:none; }
+thead th .sort-link { color:inherit; text-decoration:none; }
+thead th[aria-sort="ascending"] .sort-link::after { content:" \\25B2"; font-size:9px; }
+thead th[aria-sort="descending"] .sort-link::after { content:" \\25BC"; font-size:9px; }
+.pager { display:flex; justify-content:center; align-items:center; gap:12px; margin-top:10px; font-size:12px; }
+.pager [hidden] { display:none; }
+
+.history-table-wrapper { margin-top:8px; border-radius:8px; }
+.history-status td { text-align:center; opacity:0.75; }
+.history-more { display:block; margin:10px auto 0; }
+.history-more[hidden] { display:none; }
+
+/* use theme colours for history header */
+.history-table thead th {
+  background: var(--thead-bg);
+  color: var(--thead-color);
+}
+
+/* light-mode history row highlights */
+.history-table tbody tr.log-ongoing {
+  background:#d1fae5;
+}
+.history-table tbody tr.log-ended {
+  background:#fee2e2;
+}
+
+/* darker, glowing rows in dark theme for better sync with top table */
+html[data-theme="dark"] .history-table tbody tr.log-ongoing {
+  background: rgba(16,185,129,0.28);
+}
+html[data-theme="dark"] .history-table tbody tr.log-ended {
+  background: rgba(248,113,113,0.30);
+}
+
+@media (max-width: 820px) {
+  .container { padding:14px; width:100vw; }
+  table { font-size:12px; }
+  th, td { padding:6px; }
+  input[type="text"] { max-width:80px; }
+  input[type="datetime-local"] { max-width:140px; }
+}
+"""
+
+DASHBOARD_JS = """// ---------- Theme toggle + auto refresh ----------
+function toggleTheme() {
+  const cur = document.documentElement.getAttribute('data-theme') || 'light';
+  const next = cur === 'dark' ? 'light' : 'dark';
+  document.documentElement.setAttribute('data-theme', next);
+  localStorage.setItem('dashboard_theme', next);
+  const btn = document.getElementById('themeToggleBtn');
+  if (btn) btn.textContent = next === 'dark' ? 'Dark' : 'Light';
+}
+
+let refreshInterval = null;
+let liveConnected = false;  // while the /events stream is up, rows update in place instead
+function startAutoRefresh() {
+  if (refreshInterval || liveConnected) return;
+  refreshInterval = setInterval(() => { window.location.reload(); }, DASHBOARD.refreshMs);
+}
+function stopAutoRefresh() {
+  if (!refreshInterval) return;
+  clearInterval(refreshInterval);
+  return refreshInterval = null;
+}
+
+// ---------- Datetime limits + AM/PM label ----------
+function formatAMPM(date) {
+  const pad = n => (n < 10 ? '0' + n : n);
+  let hours = date.getHours();
+  const minutes = pad(date.getMinutes());
+  const ampm = hours >= 12 ? 'PM' : 'AM';
+  hours = hours % 12;
+  if (hours === 0) hours = 12;
+  return hours + ':' + minutes + ' ' + ampm;
+}
+
+function updateTimeLabelForInput(inp) {
+  let label = inp.nextElementSibling;
+  if (!label || !label.classList || !label.classList.contains('time-display')) {
+    label = document.createElement('span');
+    label.className = 'time-display';
+    inp.parentNode.insertBefore(label, inp.nextSibling);
+  }
+  if (inp.value) {
+    const d = new Date(inp.value);
+    if (!isNaN(d.getTime())) label.textContent = formatAMPM(d);
+    else label.textContent = '';
+  } else {
+    label.textContent = '';
+  }
+}
+
+function setDateTimeLimits(root) {
+  const inputs = (root || document).querySelectorAll('input[type="datetime-local"]');
+  if (!inputs.length) return;
+
+  const now = new Date();
+  now.setSeconds(0,0);
+  const max = new Date(now.getTime() + 30 * 24 * 60 * 60 * 1000);
+  function fmtLocal(d) {
+    const pad = n => n < 10 ? '0'+n : n;
+    return d.getFullYear() + '-' + pad(d.getMonth()+1) + '-' + pad(d.getDate()) + 'T' + pad(d.getHours()) + ':' + pad(d.getMinutes());
+  }
+  const minStr = fmtLocal(now);
+  const maxStr = fmtLocal(max);
+
+  inputs.forEach(inp => {
+    inp.setAttribute('min', minStr);
+    inp.setAttribute('max', maxStr);
+    inp.setAttribute('step', '60');
+    if (!inp.value) inp.value = minStr;
+    updateTimeLabelForInput(inp);
+    inp.addEventListener('input', function(){ updateTimeLabelForInput(inp); });
+  });
+}
+
+// ---------- Live updates: /events stream patches device rows in place ----------
+const IS_HOST = DASHBOARD.isHost;
+const LIVE_URLS = DASHBOARD.urls;
+
+function escapeHtml(s) {
+  return String(s == null ? '' : s).replace(/[&<>"']/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'}[c]));
+}
+
+function attachRowTouch(r) {
+  r.addEventListener('touchstart', function () {
+    document.querySelectorAll('tbody tr.row-popped').forEach(rr => rr.classList.remove('row-popped'));
+    r.classList.add('row-popped');
+  }, {passive:true});
+  r.addEventListener('touchend', function () {
+    setTimeout(() => r.classList.remove('row-popped'), 700);
+  });
+}
+
+// same markup as the device table loop in the page body
+function buildDeviceRow(d) {
+  const tr = document.createElement('tr');
+  tr.setAttribute('data-id', d.id);
+  tr.setAttribute('data-status', d.status);
+  tr.setAttribute('data-user', d.current_user || '');
+  tr.setAttribute('data-eta', d.eta || '');
+  tr.setAttribute('data-eta-status', d.eta_status || '');
+  tr.className = 'status-' + String(d.status).toLowerCase().replace(/ /g, '');
+
+  let badge = '<span class="eta-badge eta-none">-</span>';
+  if (d.eta_status === 'Passed') badge = '<span class="eta-badge eta-passed">PASSED</span>';
+  else if (d.eta_status === 'Active') badge = '<span class="eta-badge eta-active">ACTIVE</span>';
+
+  let actions;
+  if (d.status === 'Available') {
+    actions = `<form class="inline" method="post" action="${LIVE_URLS.lock.replace(/0$/, d.id)}">
+                 <input type="text" name="user" placeholder="Your name" required>
+                 <input class="eta-input" type="datetime-local" name="eta" required>
+                 <button type="submit" class="btn btn-lock">Lock</button>
+               </form>`;
+  } else {
+    actions = `<form class="unlock-form inline" method="post" action="${LIVE_URLS.unlock.replace(/0$/, d.id)}">
+                 <button type="submit" class="btn btn-unlock">Unlock</button>
+               </form>`;
+  }
+  if (IS_HOST) {
+    const name = escapeHtml(d.name);
+    actions += `<button class="btn btn-edit btn-small" data-edit-id="${d.id}" data-edit-name="${name}">Edit</button>
+                <button class="btn btn-delete btn-small" data-delete-id="${d.id}" data-delete-name="${name}">Delete</button>`;
+  }
+
+  tr.innerHTML = `<td>${d.id}</td>
+    <td>${escapeHtml(d.name)}</td>
+    <td><span class="tag">${escapeHtml(d.status)}</span></td>
+    <td class="user-name-display">${escapeHtml(d.current_user || '-')}</td>
+    <td>${escapeHtml(d.eta_display)}</td>
+    <td>${badge}</td>
+    <td><div class="action-group">${actions}</div></td>`;
+  return tr;
+}
+
+// ---------- Device table view: server-side filter / sort / page ----------
+let deviceView = DASHBOARD.deviceView;  // normalised by the server, echoed back by /api/devices
+let resyncTimer = null;
+
+function viewQuery(view) {
+  const q = new URLSearchParams();
+  Object.keys(DASHBOARD.deviceViewDefaults).forEach(k => {
+    if (view[k] !== DASHBOARD.deviceViewDefaults[k]) q.set(k, view[k]);
+  });
+  return q.toString();
+}
+
+function viewHref(changes) {
+  const q = viewQuery(Object.assign({}, deviceView, changes));
+  return window.location.pathname + (q ? '?' + q : '');
+}
+
+function renderDeviceRows(devices) {
+  const tbody = document.querySelector('.table-wrapper tbody');
+  if (!tbody) return;
+  const active = document.activeElement;
+  const rows = devices.map(d => {
+    const old = tbody.querySelector(`tr[data-id="${d.id}"]`);
+    if (old && old.contains(active) && old.getAttribute('data-status') === d.status) {
+      // someone is typing in this row's lock form - keep their input, refresh the name only
+      old.children[1].textContent = d.name;
+      return old;
+    }
+    const row = buildDeviceRow(d);
+    setDateTimeLimits(row);
+    attachRowTouch(row);
+    return row;
+  });
+  const keep = new Set(rows);
+  Array.from(tbody.children).forEach(tr => { if (!keep.has(tr)) tr.remove(); });
+  let cursor = tbody.firstElementChild;
+  rows.forEach(row => {
+    if (row === cursor) cursor = cursor.nextElementSibling;
+    else tbody.insertBefore(row, cursor);
+  });
+}
+
+function updateViewControls(data) {
+  document.querySelectorAll('a.sort-link[data-sort]').forEach(a => {
+    const key = a.getAttribute('data-sort');
+    const current = deviceView.sort === key;
+    a.closest('th').setAttribute('aria-sort', current ? (deviceView.dir === 'asc' ? 'ascending' : 'descending') : 'none');
+    a.href = viewHref({sort: key, dir: current && deviceView.dir === 'asc' ? 'desc' : 'asc', page: 1});
+  });
+  const prev = document.querySelector('[data-page-link="prev"]');
+  const next = document.querySelector('[data-page-link="next"]');
+  if (prev) { prev.hidden = data.page <= 1; prev.href = viewHref({page: data.page - 1}); }
+  if (next) { next.hidden = data.page >= data.pages; next.href = viewHref({page: data.page + 1}); }
+  const info = document.getElementById('pagerInfo');
+  if (info) info.textContent = `Page ${data.page} of ${data.pages} \u00b7 ${data.total} device${data.total === 1 ? '' : 's'}`;
+  const form = document.getElementById('deviceFilter');
+  if (form) {
+    ['status', 'name', 'user', 'sort', 'dir'].forEach(k => { if (form.elements[k]) form.elements[k].value = deviceView[k]; });
+  }
+}
+
+function loadDevices(search, push) {
+  const q = new URLSearchParams(search);
+  if (!q.has('page_size')) q.set('page_size', DASHBOARD.deviceViewDefaults.page_size);
+  return fetch(LIVE_URLS.devices + '?' + q.toString(), {cache: 'no-cache'})
+    .then(r => r.json())
+    .then(data => {
+      deviceView = data.view;
+      renderDeviceRows(data.devices);
+      updateViewControls(data);
+      if (push) history.pushState(null, '', viewHref({}));
+    })
+    .catch(() => {});
+}
+
+function resyncDevices() {
+  clearTimeout(resyncTimer);
+  resyncTimer = null;
+  return loadDevices(viewQuery(deviceView), false);
+}
+
+// coalesce a burst of events into one page refetch
+function scheduleResync() {
+  if (!resyncTimer) resyncTimer = setTimeout(resyncDevices, 250);
+}
+
+function applyDevice(d) {
+  const tbody = document.querySelector('.table-wrapper tbody');
+  if (!tbody) return;
+  const old = tbody.querySelector(`tr[data-id="${d.id}"]`);
+  // could the change move the device into, out of, or within this page?
+  const byState = deviceView.status || deviceView.user || ['status', 'user', 'eta'].includes(deviceView.sort);
+  const byName = deviceView.name || deviceView.sort === 'name';
+  if (!old) {
+    if (byState || byName) scheduleResync();
+    return;  // off this page and stays off it
+  }
+  if ((byState && old.getAttribute('data-status') !== d.status) ||
+      (byName && old.children[1].textContent !== d.name)) {
+    scheduleResync();
+    return;
+  }
+  if (old.contains(document.activeElement) && old.getAttribute('data-status') === d.status) {
+    old.children[1].textContent = d.name;
+    return;
+  }
+  const row = buildDeviceRow(d);
+  old.replaceWith(row);
+  setDateTimeLimits(row);
+  attachRowTouch(row);
+}
+
+function initDeviceView() {
+  document.addEventListener('click', function (e) {
+    const a = e.target.closest && e.target.closest('a.sort-link, a[data-page-link]');
+    if (!a || e.ctrlKey || e.metaKey || e.shiftKey) return;
+    e.preventDefault();
+    loadDevices(new URL(a.href).search, true);
+  });
+  const form = document.getElementById('deviceFilter');
+  if (form) {
+    form.addEventListener('submit', function (e) {
+      e.preventDefault();
+      const q = new URLSearchParams();
+      new FormData(form).forEach((v, k) => { if (String(v).trim()) q.set(k, String(v).trim()); });
+      loadDevices(q.toString(), true);
+    });
+  }
+  window.addEventListener('popstate', () => loadDevices(window.location.search, false));
+}
+
+// ---------- Usage history: keyset pages from /api/history, loaded on scroll ----------
+let historyNextBefore = null;  // id cursor for the next older page; null once exhausted
+let historyLoading = false;
+
+// same columns as the history table header
+function buildHistoryRow(l) {
+  const tr = document.createElement('tr');
+  tr.setAttribute('data-log-id', l.id);
+  tr.className = l.is_ongoing ? 'log-ongoing' : 'log-ended';
+  tr.innerHTML = `<td>${l.device_id}</td>
+    <td>${escapeHtml(l.device_name)}</td>
+    <td>${escapeHtml(l.user)}</td>
+    <td>${escapeHtml(l.start_display)}</td>
+    <td>${escapeHtml(l.end_display)}</td>
+    <td>${escapeHtml(l.duration)}</td>`;
+  return tr;
+}
+
+function setHistoryStatus(text) {
+  const status = document.getElementById('historyStatus');
+  const more = document.getElementById('historyMore');
+  if (status) {
+    status.hidden = !text;
+    status.firstElementChild.textContent = text || '';
+  }
+  if (more) more.hidden = historyNextBefore === null;
+}
+
+function historyUrl(beforeId) {
+  const u = new URL(LIVE_URLS.history, window.location.href);
+  if (beforeId !== null) u.searchParams.set('before_id', beforeId);
+  return u.toString();
+}
+
+function loadHistoryPage() {
+  const tbody = document.getElementById('historyBody');
+  if (!tbody || historyLoading) return;
+  const first = !tbody.querySelector('tr[data-log-id]');
+  if (!first && historyNextBefore === null) return;
+  historyLoading = true;
+  fetch(historyUrl(first ? null : historyNextBefore))
+    .then(r => r.json())
+    .then(data => {
+      data.logs.forEach(l => {
+        if (!tbody.querySelector(`tr[data-log-id="${l.id}"]`)) tbody.appendChild(buildHistoryRow(l));
+      });
+      historyNextBefore = data.next_before_id;
+      const empty = !tbody.querySelector('tr[data-log-id]');
+      setHistoryStatus(empty ? 'No usage history yet. Lock a device to start logging.' : '');
+    })
+    .catch(() => setHistoryStatus('Could not load history.'))
+    .finally(() => {
+      historyLoading = false;
+      checkHistorySentinel();  // page did not fill the view - keep going
+    });
+}
+
+// newest page again after a lock/unlock: prepend new sessions, patch rows that ended
+function refreshHistoryHead() {
+  const tbody = document.getElementById('historyBody');
+  if (!tbody || !tbody.querySelector('tr[data-log-id]')) return;  // not loaded yet, nothing to patch
+  fetch(historyUrl(null), {cache: 'no-cache'})
+    .then(r => r.json())
+    .then(data => {
+      // oldest first, so each new session lands on top of the one before it
+      data.logs.slice().reverse().forEach(l => {
+        const old = tbody.querySelector(`tr[data-log-id="${l.id}"]`);
+        const top = tbody.querySelector('tr[data-log-id]');
+        if (old) old.replaceWith(buildHistoryRow(l));
+        else if (Number(top.getAttribute('data-log-id')) < l.id) tbody.insertBefore(buildHistoryRow(l), top);
+      });
+      setHistoryStatus('');
+    })
+    .catch(() => {});
+}
+
+function checkHistorySentinel() {
+  const more = document.getElementById('historyMore');
+  if (!more || more.hidden) return;
+  const rect = more.getBoundingClientRect();
+  if (rect.top < window.innerHeight + 200) loadHistoryPage();
+}
+
+function initHistory() {
+  const more = document.getElementById('historyMore');
+  if (!document.getElementById('historyBody')) return;
+  if (more) {
+    more.addEventListener('click', loadHistoryPage);
+    if (window.IntersectionObserver) {
+      new IntersectionObserver(entries => {
+        if (entries.some(e => e.isIntersecting)) loadHistoryPage();
+      }, {rootMargin: '200px'}).observe(more);
+    }
+  }
+  loadHistoryPage();
+}
+
+// ---------- Log downloads: background export job, polled until the file is ready ----------
+function initDownloads() {
+  const form = document.querySelector('.download-form');
+  const status = document.getElementById('downloadStatus');
+  if (!form || !window.fetch) return;  // plain GET to /download_logs streams it instead
+  let busy = false;
+  form.addEventListener('submit', function (e) {
+    e.preventDefault();
+    if (busy) return;
+    busy = true;
+    const show = text => { if (status) status.textContent = text; };
+    const finish = job => {
+      busy = false;
+      show('');
+      window.location.href = job.download_url;
+    };
+    const poll = job => {
+      if (job.status === 'done') return finish(job);
+      if (job.status === 'failed') throw new Error(job.error || 'export failed');
+      show(`Preparing\u2026 ${Math.round(job.progress * 100)}%`);
+      setTimeout(() => {
+        fetch(job.progress_url, {cache: 'no-cache'}).then(r => r.json()).then(poll).catch(fallback);
+      }, 500);
+    };
+    const fallback = () => {
+      // job API unavailable or the job failed - stream it directly as before
+      busy = false;
+      show('');
+      form.submit();
+    };
+    fetch(LIVE_URLS.exports, {method: 'POST', body: new FormData(form)})
+      .then(r => { if (!r.ok) throw new Error(r.status); return r.json(); })
+      .then(poll)
+      .catch(fallback);
+  });
+}
+
+function connectLive() {
+  if (!window.EventSource) return;  // old browsers keep the periodic reload
+  const es = new EventSource(LIVE_URLS.events);
+  let dropped = false;
+  es.onopen = function () {
+    liveConnected = true;
+    stopAutoRefresh();
+    if (dropped) { dropped = false; resyncDevices(); }  // catch up on events missed while away
+  };
+  es.onerror = function () {
+    liveConnected = false;
+    dropped = true;
+    startAutoRefresh();  // poll until EventSource reconnects
+  };
+  ['lock', 'unlock', 'edit', 'overdue'].forEach(kind => {
+    es.addEventListener(kind, ev => applyDevice(JSON.parse(ev.data)));
+  });
+  ['lock', 'unlock', 'edit'].forEach(kind => es.addEventListener(kind, refreshHistoryHead));
+  // these shift which devices land on the current page
+  ['add', 'delete', 'recover', 'import'].forEach(kind => es.addEventListener(kind, scheduleResync));
+}
+
+// ---------- Main JS: modals, CRUD, theme button, host controls ----------
+document.addEventListener('DOMContentLoaded', function () {
+  setDateTimeLimits();
+  startAutoRefresh();
+
+  const confirmModal = document.getElementById('confirmModal');
+  const modalTitle = document.getElementById('modalTitle');
+  const modalMessage = document.getElementById('modalMessage');
+  const modalYes = document.getElementById('modalYes');
+  const modalNo = document.getElementById('modalNo');
+
+  const deviceModal = document.getElementById('deviceModal');
+  const deviceForm = document.getElementById('deviceForm');
+  const deviceNameInput = document.getElementById('deviceName');
+  const deviceActionInput = document.getElementById('deviceAction');
+  const deviceIdInput = document.getElementById('deviceId');
+  const deviceClose = document.getElementById('deviceClose');
+  const addDeviceBtn = document.getElementById('addDeviceBtn');
+  const recoverBtn = document.getElementById('recoverBtn');
+  const rebuildLogsBtn = document.getElementById('rebuildLogsBtn');
+
+  const deleteModal = document.getElementById('deleteModal');
+  const deleteYes = document.getElementById('deleteYes');
+  const deleteNo = document.getElementById('deleteNo');
+  let deleteTargetId = null;
+
+  let pendingUnlockForm = null;
+
+  function openConfirm(title, message, onYes) {
+    modalTitle.textContent = title;
+    modalMessage.textContent = message;
+    confirmModal.style.display = 'flex';
+    stopAutoRefresh();
+    modalYes.onclick = function(){ confirmModal.style.display='none'; startAutoRefresh(); onYes && onYes(); };
+    modalNo.onclick = function(){ confirmModal.style.display='none'; startAutoRefresh(); };
+  }
+
+  function showDeviceModal(action, id, name) {
+    deviceActionInput.value = action;
+    deviceIdInput.value = id || '';
+    deviceNameInput.value = name || '';
+    deviceModal.style.display = 'flex';
+    stopAutoRefresh();
+    deviceNameInput.focus();
+  }
+  function closeDeviceModal() {
+    deviceModal.style.display = 'none';
+    startAutoRefresh();
+  }
+
+  function openDeleteConfirm(id, name) {
+    deleteTargetId = id;
+    document.getElementById('deleteMessage').textContent = `Delete "${name}"? This cannot be undone.`;
+    deleteModal.style.display = 'flex';
+    stopAutoRefresh();
+  }
+  function closeDeleteConfirm() {
+    deleteModal.style.display = 'none';
+    deleteTargetId = null;
+    startAutoRefresh();
+  }
+
+  if (addDeviceBtn) {
+    addDeviceBtn.addEventListener('click', function(){
+      showDeviceModal('add', '', '');
+    });
+  }
+
+  if (recoverBtn) {
+    recoverBtn.addEventListener('click', function(){
+      const f = document.createElement('form');
+      f.method = 'POST'; f.action = DASHBOARD.urls.recover;
+      document.body.appendChild(f); f.submit();
+    });
+  }
+
+  if (rebuildLogsBtn) {
+    rebuildLogsBtn.addEventListener('click', function(){
+      openConfirm('Rebuild Logs', 'Rewrite logs.csv from the full history? This can take a while.', function(){
+        const f = document.createElement('form');
+        f.method = 'POST'; f.action = DASHBOARD.urls.rebuild_logs;
+        document.body.appendChild(f); f.submit();
+      });
+    });
+  }
+
+  deviceClose.addEventListener('click', closeDeviceModal);
+
+  deviceForm.addEventListener('submit', function(e){
+    e.preventDefault();
+    const action = deviceActionInput.value;
+    const id = deviceIdInput.value;
+    const name = deviceNameInput.value.trim();
+    if (!name) return;
+    if (action === 'add') {
+      const f = document.createElement('form');
+      f.method = 'POST'; f.action = DASHBOARD.urls.add;
+      const ni = document.createElement('input'); ni.name = 'name'; ni.value = name; f.appendChild(ni);
+      document.body.appendChild(f); f.submit();
+    } else if (action === 'edit') {
+      const f = document.createElement('form');
+      f.method = 'POST'; f.action = DASHBOARD.urls.edit.replace(/0$/, id);
+      const ni = document.createElement('input'); ni.name = 'name'; ni.value = name; f.appendChild(ni);
+      document.body.appendChild(f); f.submit();
+    }
+  });
+
+  deleteYes.addEventListener('click', function(){
+    if (!deleteTargetId) return closeDeleteConfirm();
+    const f = document.createElement('form');
+    f.method = 'POST'; f.action = DASHBOARD.urls.delete.replace(/0$/, deleteTargetId);
+    document.body.appendChild(f); f.submit();
+  });
+  deleteNo.addEventListener('click', closeDeleteConfirm);
+
+  document.addEventListener('submit', function (ev) {
+    const form = ev.target;
+    if (form.classList && form.classList.contains('unlock-form')) {
+      ev.preventDefault();
+      const row = form.closest('tr');
+      pendingUnlockForm = form;
+      const deviceId = row.getAttribute('data-id') || '?';
+      const etaStatus = row.getAttribute('data-eta-status') || '';
+      if (etaStatus === 'Passed') {
+        openConfirm('ETA Passed — Confirm Unlock', `Device ${deviceId} has reached its ETA. Unlock now?`, function(){
+          pendingUnlockForm.submit();
+        });
+      } else {
+        openConfirm('Release Device', `Do you want to release Device ${deviceId}?`, function(){
+          pendingUnlockForm.submit();
+        });
+      }
+    }
+  });
+
+  document.addEventListener('click', function(e){
+    const el = e.target;
+    if (el.matches('[data-edit-id], [data-edit-id] *')) {
+      const btn = el.closest('[data-edit-id]');
+      const id = btn.getAttribute('data-edit-id');
+      const name = btn.getAttribute('data-edit-name') || '';
+      showDeviceModal('edit', id, name);
+      e.preventDefault();
+      return;
+    }
+    if (el.matches('[data-delete-id], [data-delete-id] *')) {
+      const btn = el.closest('[data-delete-id]');
+      const id = btn.getAttribute('data-delete-id');
+      const name = btn.getAttribute('data-delete-name') || '';
+      const row = btn.closest('tr');
+      const status = row ? row.getAttribute('data-status') : null;
+      if (status === 'In Use') {
+        alert('Cannot delete device while it is locked (In Use). Release/unlock first.');
+        e.preventDefault();
+        return;
+      }
+      openDeleteConfirm(id, name);
+      e.preventDefault();
+      return;
+    }
+    if (el.id === 'themeToggleBtn' || (el.closest && el.closest('#themeToggleBtn'))) {
+      toggleTheme();
+    }
+  });
+
+  [deviceModal, confirmModal, deleteModal].forEach(md => {
+    md.addEventListener('click', function(ev){
+      if (ev.target === md) {
+        md.style.display = 'none';
+        startAutoRefresh();
+      }
+    });
+  });
+
+  document.addEventListener('keydown', function(e){
+    if (e.key === 'Escape') {
+      [deviceModal, confirmModal, deleteModal].forEach(md => { if (md.style.display === 'flex') md.style.display = 'none'; });
+      startAutoRefresh();
+    }
+  });
+
+  document.querySelectorAll('tbody tr').forEach(attachRowTouch);
+
+  const tableWrapper = document.querySelector('.table-wrapper');
+  if (tableWrapper) {
+    tableWrapper.addEventListener('scroll', function () {
+      document.querySelectorAll('tbody tr.row-popped').forEach(rr => rr.classList.remove('row-popped'));
+    }, {passive:true});
+  }
+
+  initDeviceView();
+  initHistory();
+  initDownloads();
+  connectLive();
+
+  const tbtn = document.getElementById('themeToggleBtn');
+  if (tbtn) {
+    const cur = document.documentElement.getAttribute('data-theme') || 'light';
+    tbtn.textContent = cur === 'dark' ? 'Dark' : 'Light';
+  }
+});
+"""
+
+# ---------- HTML TEMPLATE ----------
+TEMPLATE = """<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>Device Availability Dashboard</title>
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+
+  <link rel="stylesheet" href="{{ asset_url('dashboard.css') }}">
+
+  <!-- Theme (inline so the first paint already uses the saved theme) -->
+  <script>
+    (function(){
+      const saved = localStorage.getItem('dashboard_theme');
+      if (saved) {
+        document.documentElement.setAttribute('data-theme', saved);
+      } else {
+        const prefersDark = window.matchMedia && window.matchMedia('(prefers-color-scheme: dark)').matches;
+        document.documentElement.setAttribute('data-theme', prefersDark ? 'dark' : 'light');
+      }
+    })();
+  </script>
+
+  <!-- Page config for dashboard.js (modals, CRUD, live updates, auto refresh) -->
+  <script>
+    window.DASHBOARD = {
+      refreshMs: {{ refresh_ms }},
+      isHost: {{ is_host|tojson }},
+      urls: {{ urls|tojson }},
+      deviceView: {{ view|tojson }},
+      deviceViewDefaults: {{ view_defaults|tojson }}
+    };
+  </script>
+  <script src="{{ asset_url('dashboard.js') }}" defer></script>
+
+</head>
+<body>
+  <div class="container">
+    <div class="header">
+      <div>
+        <h2>Device Availability</h2>
+        <div class="subtitle">Green = Available, Red = In Use</div>
+      </div>
+
+      <div class="controls">
+        <button id="addDeviceBtn" class="btn-action">ADD DEVICE</button>
+        {% if is_host %}
+        <button id="recoverBtn" class="btn-action" title="Recover missing devices">RECOVER ID</button>
+        <button id="rebuildLogsBtn" class="btn-action" title="Rewrite logs.csv from the database">REBUILD LOGS</button>
+        {% endif %}
+        <button id="themeToggleBtn" class="btn-action" title="Toggle theme">Theme</button>
+      </div>
+    </div>
+
+    <!-- DEVICE TABLE: one server-side page of the filtered, sorted list -->
+    {% macro sort_th(key, label, style='') -%}
+      <th{% if style %} style="{{ style }}"{% endif %}
+          aria-sort="{% if view.sort == key %}{{ 'ascending' if view.dir == 'asc' else 'descending' }}{% else %}none{% endif %}">
+        <a class="sort-link" data-sort="{{ key }}"
+           href="{{ device_view_url(view, sort=key, dir='desc' if view.sort == key and view.dir == 'asc' else 'asc', page=1) }}">{{ label }}</a>
+      </th>
+    {%- endmacro %}
+    <form id="deviceFilter" class="device-filter" method="get" action="{{ url_for('index') }}">
+      <select name="status" aria-label="Status">
+        <option value="">All statuses</option>
+        {% for s in statuses %}
+        <option value="{{ s }}"{% if view.status == s %} selected{% endif %}>{{ s }}</option>
+        {% endfor %}
+      </select>
+      <input type="text" name="name" value="{{ view.name }}" placeholder="Device name" aria-label="Device name starts with">
+      <input type="text" name="user" value="{{ view.user }}" placeholder="User" aria-label="User starts with">
+      <input type="hidden" name="sort" value="{{ view.sort }}">
+      <input type="hidden" name="dir" value="{{ view.dir }}">
+      <button type="submit" class="btn btn-filter">Filter</button>
+    </form>
+
+    <div class="table-wrapper" role="region" aria-label="Device list">
+      <table>
+        <thead>
+          <tr>
+            {{ sort_th('id', 'ID', 'width:48px') }}
+            {{ sort_th('name', 'Device Name') }}
+            {{ sort_th('status', 'Status') }}
+            {{ sort_th('user', 'Current User') }}
+            {{ sort_th('eta', 'ETA') }}
+            <th>ETA Status</th>
+            <th>Actions</th>
+          </tr>
+        </thead>
+        <tbody>
+          {% for d in devices %}
+          <tr
+            data-id="{{ d['id'] }}"
+            data-status="{{ d['status'] }}"
+            data-user="{{ d['current_user'] or '' }}"
+            data-eta="{{ d['eta'] or '' }}"
+            data-eta-status="{{ d.get('eta_status','') }}"
+            class="status-{{ d['status']|lower|replace(' ', '') }}">
+            <td>{{ d['id'] }}</td>
+            <td>{{ d['name'] }}</td>
+            <td><span class="tag">{{ d['status'] }}</span></td>
+            <td class="user-name-display">{{ d['current_user'] or '-' }}</td>
+            <td>{{ d['eta_display'] }}</td>
+            <td>
+              {% if d.get('eta_status') == 'Passed' %}
+                <span class="eta-badge eta-passed">PASSED</span>
+              {% elif d.get('eta_status') == 'Active' %}
+                <span class="eta-badge eta-active">ACTIVE</span>
+              {% else %}
+                <span class="eta-badge eta-none">-</span>
+              {% endif %}
+            </td>
+            <td>
+              <div class="action-group">
+                {% if d['status'] == 'Available' %}
+                  <form class="inline" method="post" action="{{ url_for('lock_device', device_id=d['id']) }}">
+                    <input type="text" name="user" placeholder="Your name" required>
+                    <input class="eta-input" type="datetime-local" name="eta" required>
+                    <button type="submit" class="btn btn-lock">Lock</button>
+                  </form>
+                {% else %}
+                  <form class="unlock-form inline" method="post" action="{{ url_for('unlock_device', device_id=d['id']) }}">
+                    <button type="submit" class="btn btn-unlock">Unlock</button>
+                  </form>
+                {% endif %}
+
+                {% if is_host %}
+                  <button class="btn btn-edit btn-small" data-edit-id="{{ d['id'] }}" data-edit-name="{{ d['name'] }}">Edit</button>
+                  <button class="btn btn-delete btn-small" data-delete-id="{{ d['id'] }}" data-delete-name="{{ d['name'] }}">Delete</button>
+                {% endif %}
+              </div>
+            </td>
+          </tr>
+          {% endfor %}
+        </tbody>
+      </table>
+    </div>
+    <div class="pager">
+      <a class="btn btn-page" data-page-link="prev" href="{{ device_view_url(view, page=page.page - 1) }}"{% if page.page <= 1 %} hidden{% endif %}>&lsaquo; Prev</a>
+      <span id="pagerInfo">Page {{ page.page }} of {{ page.pages }} &middot; {{ page.total }} device{{ '' if page.total == 1 else 's' }}</span>
+      <a class="btn btn-page" data-page-link="next" href="{{ device_view_url(view, page=page.page + 1) }}"{% if page.page >= page.pages %} hidden{% endif %}>Next &rsaquo;</a>
+    </div>
+
+    <!-- USAGE HISTORY -->
+    <div class="history-section">
+      <div class="history-header-row">
+        <div>
+          <h3 class="history-title">Recent Usage History</h3>
+          <div class="history-note">Green = Ongoing (still using), Red = Completed usage</div>
+        </div>
+
+        <form class="download-form" method="get" action="{{ url_for('download_logs') }}">
+          <label>
+            From
+            <input type="date" name="start_date" max="{{ today }}">
+          </label>
+          <label>
+            To
+            <input type="date" name="end_date" max="{{ today }}">
+          </label>
+          <select name="format" aria-label="File format">
+            {% for value, label in download_formats %}
+            <option value="{{ value }}">{{ label }}</option>
+            {% endfor %}
+          </select>
+          <button type="submit" class="btn-download">Download Logs</button>
+          <span id="downloadStatus" class="download-status" aria-live="polite"></span>
+        </form>
+      </div>
+
+      <div class="history-table-wrapper" role="region" aria-label="Usage history">
+        <table class="history-table">
+          <thead>
+            <tr>
+              <th style="width:48px">ID</th>
+              <th>Device Name</th>
+              <th>User</th>
+              <th>From</th>
+              <th>To</th>
+              <th>Duration</th>
+            </tr>
+          </thead>
+          <!-- filled page by page from /api/history by dashboard.js -->
+          <tbody id="historyBody"></tbody>
+          <tbody>
+            <tr id="historyStatus" class="history-status">
+              <td colspan="6">Loading history&hellip;</td>
+            </tr>
+          </tbody>
+        </table>
+        <button type="button" id="historyMore" class="btn history-more" hidden>Load older</button>
+      </div>
+    </div>
+
+  </div>
+
+  <!-- Confirm modal -->
+  <div id="confirmModal" class="modal-backdrop" aria-hidden="true" role="dialog" aria-modal="true">
+    <div class="modal" role="document">
+      <h3 id="modalTitle">Confirm</h3>
+      <p id="modalMessage">Are you sure?</p>
+      <div class="actions">
+        <button id="modalYes" class="btn-yes">Yes</button>
+        <button id="modalNo" class="btn-no">No</button>
+      </div>
+    </div>
+  </div>
+
+  <!-- Device modal -->
+  <div id="deviceModal" class="modal-backdrop" style="display:none;">
+    <div class="modal">
+      <h3 id="deviceModalTitle">Device</h3>
+      <form id="deviceForm">
+        <input type="hidden" id="deviceAction" name="action" value="add">
+        <input type="hidden" id="deviceId" name="device_id" value="">
+        <input type="text" id="deviceName" name="name" placeholder="Device name" required>
+        <div class="actions">
+          <button type="submit" class="btn-yes">Save</button>
+          <button type="button" id="deviceClose" class="btn-no">Cancel</button>
+        </div>
+      </form>
+    </div>
+  </div>
+
+  <!-- Delete confirm -->
+  <div id="deleteModal" class="modal-backdrop" style="display:none;">
+    <div class="modal">
+      <h3>Delete Device</h3>
+      <p id="deleteMessage">Are you sure?</p>
+      <div class="actions">
+        <button id="deleteYes" class="btn-yes">Delete</button>
+        <button id="deleteNo" class="btn-no">Cancel</button>
+      </div>
+    </div>
+  </div>
+
+</body>
+</html>
+"""
+
+ASSETS = {}       # hashed filename -> (body, mimetype)
+ASSET_NAMES = {}  # logical name -> hashed filename
+
+def register_asset(name, text, mimetype):
+    body = text.encode("utf-8")
+    stem, ext = os.path.splitext(name)
+    hashed = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+    ASSETS[hashed] = (body, mimetype)
+    ASSET_NAMES[name] = hashed
+
+register_asset("dashboard.css", DASHBOARD_CSS, "text/css")
+register_asset("dashboard.js", DASHBOARD_JS, "application/javascript")
+
+def asset_url(name):
+    return url_for("asset", filename=ASSET_NAMES[name])
+
+app.jinja_env.globals["asset_url"] = asset_url
+DASHBOARD_TEMPLATE = app.jinja_env.from_string(TEMPLATE)  # compiled once, not per request
+
+def render_dashboard(**context):
+    app.update_template_context(context)
+    return DASHBOARD_TEMPLATE.render(context)
+
+def device_view_url(view, **changes):
+    return url_for("index", **device_view_args(view, **changes))
+
+app.jinja_env.globals["device_view_url"] = device_view_url
+
+def dashboard_urls():
+    """endpoints dashboard.js needs; per-device ones end in /0 and get the id swapped in"""
+    return {
+        "events": url_for("events"),
+        "devices": url_for("api_devices"),
+        "history": url_for("api_history"),
+        "lock": url_for("lock_device", device_id=0),
+        "unlock": url_for("unlock_device", device_id=0),
+        "add": url_for("add_device"),
+        "edit": url_for("edit_device", device_id=0),
+        "delete": url_for("delete_device", device_id=0),
+        "recover": url_for("recover"),
+        "rebuild_logs": url_for("rebuild_logs"),
+        "exports": url_for("create_export_job"),
+    }
+
+# ---------- DB helpers ----------
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to the pool instead of closing it"""
+    def close(self):
+        release_db(self)
+
+    def discard(self):
+        sqlite3.Connection.close(self)
+
+_db_pool = []
+_db_pool_lock = threading.Lock()
+
+def _open_db():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # pooled connections move between request threads
+        cached_statements=DB_STATEMENT_CACHE,
+        factory=PooledConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def get_db():
+    """check out a pooled connection; callers still conn.close() when done"""
+    with _db_pool_lock:
+        if _db_pool:
+            return _db_pool.pop()
+    return _open_db()
+
+def release_db(conn):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.discard()
+        return
+    with _db_pool_lock:
+        if any(c is conn for c in _db_pool):
+            return  # already released
+        if len(_db_pool) < DB_POOL_SIZE:
+            _db_pool.append(conn)
+            return
+    conn.discard()
+
+def close_db_pool():
+    with _db_pool_lock:
+        conns = _db_pool[:]
+        del _db_pool[:]
+    for conn in conns:
+        conn.discard()
+
+atexit.register(close_db_pool)
+
+_inherited_db_conns = []
+
+def _reset_db_pool_after_fork():
+    """connections opened before a fork belong to the parent: never use or close them in the child"""
+    global _db_pool_lock
+    _inherited_db_conns.extend(_db_pool)
+    del _db_pool[:]
+    _db_pool_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_db_pool_after_fork)
+
+def init_db(sync_log_file=True):
+    """
+    Create / migrate the database. sync_log_file=False is for the CLI commands:
+    they may run next to a server, and logs.csv must have a single writer.
+    """
+    create = not os.path.exists(DB_PATH)
+    conn = get_db()
+    if create:
+        conn.execute("""
+            CREATE TABLE devices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'Available',
+                current_user TEXT,
+                eta TEXT
+            )
+        """)
+        for i in range(1, 16):
+            conn.execute("INSERT INTO devices (name) VALUES (?)", (f"Device {i}",))
+        conn.commit()
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            user TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT,
+            FOREIGN KEY(device_id) REFERENCES devices(id)
+        )
+    """)
+    conn.commit()
+    migrate_db(conn)
+    for label, bad in check_query_plans(conn):
+        print(f"[DB] {label} query is not index-backed:", "; ".join(bad))
+    conn.close()
+
+    if sync_log_file:
+        sync_logs_to_file()
+
+# ---------- schema migrations (PRAGMA user_version) ----------
+def _migration_log_indexes(conn):
+    # range filters / ordering on start_time and the "open session of a device" lookup
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_start_time ON logs(start_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_device_end ON logs(device_id, end_time)")
+
+def _migration_epoch_columns(conn):
+    # integer epoch copies of the ISO timestamps ('utc' = the text is local time);
+    # devices is small and converted here, logs is backfilled by backfill_log_epochs()
+    conn.execute("ALTER TABLE devices ADD COLUMN eta_ts INTEGER")
+    conn.execute("ALTER TABLE logs ADD COLUMN start_ts INTEGER")
+    conn.execute("ALTER TABLE logs ADD COLUMN end_ts INTEGER")
+    conn.execute("""
+        UPDATE devices SET eta_ts = CAST(strftime('%s', eta, 'utc') AS INTEGER)
+        WHERE eta IS NOT NULL
+    """)
+
+def _migration_free_device_ids(conn):
+    # unused device ids below MAX(id), kept in step by triggers so /add and
+    # /recover never walk the whole devices table
+    conn.execute("CREATE TABLE free_device_ids (id INTEGER PRIMARY KEY)")
+    conn.execute("""
+        INSERT INTO free_device_ids (id)
+        WITH RECURSIVE seq(n) AS (
+            SELECT 1
+            UNION ALL
+            SELECT n + 1 FROM seq WHERE n + 1 < (SELECT MAX(id) FROM devices)
+        )
+        SELECT n FROM seq
+        WHERE n < (SELECT MAX(id) FROM devices)
+          AND n NOT IN (SELECT id FROM devices)
+    """)
+    conn.execute("""
+        CREATE TRIGGER devices_claim_id AFTER INSERT ON devices BEGIN
+            DELETE FROM free_device_ids WHERE id = NEW.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER devices_release_id AFTER DELETE ON devices BEGIN
+            INSERT OR IGNORE INTO free_device_ids (id)
+                SELECT OLD.id WHERE OLD.id < (SELECT MAX(id) FROM devices);
+            -- deleting the top id turns the gaps just under it into "past the end"
+            DELETE FROM free_device_ids
+                WHERE id > (SELECT COALESCE(MAX(id), 0) FROM devices);
+        END
+    """)
+
+def _migration_device_indexes(conn):
+    # one per device table sort / filter (see DEVICE_SORTS); NOCASE to serve the prefix filters
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_status ON devices(status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_name ON devices(name COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_user ON devices(current_user COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_eta ON devices(eta_ts)")
+
+def _migration_usage_daily(conn):
+    # busy minutes / sessions per local day, device and user; fed by unlock and
+    # backfill_usage_rollups(), logs.rolled_up marks the sessions already counted
+    conn.execute("""
+        CREATE TABLE usage_daily (
+            day TEXT NOT NULL,
+            device_id INTEGER NOT NULL,
+            user TEXT NOT NULL,
+            busy_minutes INTEGER NOT NULL DEFAULT 0,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, device_id, user)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_usage_daily_device ON usage_daily(device_id, day)")
+    conn.execute("CREATE INDEX idx_usage_daily_user ON usage_daily(user, day)")
+    conn.execute("ALTER TABLE logs ADD COLUMN rolled_up INTEGER NOT NULL DEFAULT 0")
+
+def _migration_reservations(conn):
+    # bookings never overlap per device (enforced on insert), so (device_id, start_ts)
+    # orders them end to end and an overlap check is one or two index seeks
+    conn.execute("""
+        CREATE TABLE reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id INTEGER NOT NULL,
+            user TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            CHECK (end_ts > start_ts),
+            FOREIGN KEY(device_id) REFERENCES devices(id)
+        )
+    """)
+    conn.execute("CREATE INDEX idx_reservations_device_start ON reservations(device_id, start_ts)")
+    conn.execute("CREATE INDEX idx_reservations_end ON reservations(end_ts)")
+    # ids are reused by /add and /recover - a new device must not inherit old bookings
+    conn.execute("""
+        CREATE TRIGGER devices_drop_reservations AFTER DELETE ON devices BEGIN
+            DELETE FROM reservations WHERE device_id = OLD.id;
+        END
+    """)
+
+def _migration_log_change_seq(conn):
+    # export cache invalidation: every logs write stamps its start day with the
+    # next value of one global counter, device renames / deletes stamp '*' (names
+    # are in every export). MAX(seq) over a day range + '*' changes iff that
+    # range's export output can have changed.
+    conn.execute("""
+        CREATE TABLE log_day_changes (
+            day TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_log_day_changes_seq ON log_day_changes(seq)")
+    stamp = """
+        INSERT INTO log_day_changes (day, seq)
+        VALUES ({day}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM log_day_changes))
+        ON CONFLICT (day) DO UPDATE SET seq = excluded.seq;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER logs_stamp_insert AFTER INSERT ON logs BEGIN
+            {stamp.format(day="substr(NEW.start_time, 1, 10)")}
+        END
+    """)
+    # rolled_up / epoch backfills don't change what an export shows
+    conn.execute(f"""
+        CREATE TRIGGER logs_stamp_update AFTER UPDATE OF device_id, user, start_time, end_time ON logs BEGIN
+            {stamp.format(day="substr(OLD.start_time, 1, 10)")}
+            {stamp.format(day="substr(NEW.start_time, 1, 10)")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER logs_stamp_delete AFTER DELETE ON logs BEGIN
+            {stamp.format(day="substr(OLD.start_time, 1, 10)")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER devices_stamp_rename AFTER UPDATE OF name ON devices BEGIN
+            {stamp.format(day="'*'")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER devices_stamp_delete AFTER DELETE ON devices BEGIN
+            {stamp.format(day="'*'")}
+        END
+    """)
+
+def _migration_event_log(conn):
+    # live-update events under serve: the publishing worker inserts, every worker
+    # tails it for its own /events streams; the housekeeper trims it to EVENT_LOG_KEEP
+    conn.execute("""
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+    """)
+
+def _migration_device_insert_stamp(conn):
+    # /add, /recover and imports reuse freed ids: the old device's sessions join
+    # the new row again, so every export range can change, same as a rename
+    conn.execute("""
+        CREATE TRIGGER devices_stamp_insert AFTER INSERT ON devices BEGIN
+            INSERT INTO log_day_changes (day, seq)
+            VALUES ('*', (SELECT COALESCE(MAX(seq), 0) + 1 FROM log_day_changes))
+            ON CONFLICT (day) DO UPDATE SET seq = excluded.seq;
+        END
+    """)
+
+def _migration_unrolled_index(conn):
+    # closed sessions still missing from usage_daily: normally just the ones an
+    # unlock is rolling up, so the startup backfill finds its work (or none) at once
+    conn.execute("CREATE INDEX idx_logs_unrolled ON logs(id) WHERE end_time IS NOT NULL AND rolled_up = 0")
+
+# append only - user_version N means MIGRATIONS[:N] have been applied
+MIGRATIONS = [
+    _migration_log_indexes,
+    _migration_epoch_columns,
+    _migration_free_device_ids,
+    _migration_device_indexes,
+    _migration_usage_daily,
+    _migration_reservations,
+    _migration_log_change_seq,
+    _migration_event_log,
+    _migration_device_insert_stamp,
+    _migration_unrolled_index,
+]
+
+def migrate_db(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[DB] schema migrated to version {number} ({step.__name__})")
+
+def backfill_log_epochs():
+    """fill logs.start_ts / end_ts for rows written before the epoch columns existed"""
+    conn = get_db()
+    hi = conn.execute("SELECT COALESCE(MAX(id), 0) AS m FROM logs WHERE start_ts IS NULL").fetchone()["m"]
+    conn.close()
+    lo = 0
+    filled = 0
+    while lo < hi:
+        conn = get_db()
+        cur = conn.execute("""
+            UPDATE logs
+            SET start_ts = CAST(strftime('%s', start_time, 'utc') AS INTEGER),
+                end_ts = CAST(strftime('%s', end_time, 'utc') AS INTEGER)
+            WHERE id > ? AND id <= ? AND start_ts IS NULL
+        """, (lo, lo + BACKFILL_BATCH_ROWS))
+        conn.commit()
+        conn.close()
+        filled += cur.rowcount
+        lo += BACKFILL_BATCH_ROWS
+        time.sleep(BACKFILL_PAUSE_SECONDS)  # short write transactions, requests get the lock in between
+    if filled:
+        print(f"[DB] backfilled epoch columns for {filled} log rows")
+
+# ---------- daily usage rollups ----------
+ROLLUP_SESSIONS_SQL = """
+    SELECT id, device_id, user, start_time, end_time FROM logs
+    WHERE end_time IS NOT NULL AND rolled_up = 0
+"""
+
+def split_session_days(start_time, end_time):
+    """[(day, minutes)] for a session; one that runs past midnight is cut at each midnight"""
+    start = datetime.fromisoformat(start_time)
+    end = max(datetime.fromisoformat(end_time), start)
+    parts = []
+    while True:
+        midnight = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+        cut = min(end, midnight)
+        parts.append((start.date().isoformat(), int((cut - start).total_seconds()) // 60))
+        if cut >= end:
+            return parts
+        start = cut
+
+def rollup_sessions(conn, sessions):
+    """
+    Add closed sessions to usage_daily and flag them rolled up, inside the
+    caller's transaction. A session counts once, on the day it started; its
+    minutes go to every day it covered.
+    """
+    totals = {}
+    for r in sessions:
+        for n, (day, minutes) in enumerate(split_session_days(r["start_time"], r["end_time"])):
+            t = totals.setdefault((day, r["device_id"], r["user"]), [0, 0])
+            t[0] += minutes
+            t[1] += n == 0
+    conn.executemany("""
+        INSERT INTO usage_daily (day, device_id, user, busy_minutes, sessions)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (day, device_id, user) DO UPDATE SET
+            busy_minutes = busy_minutes + excluded.busy_minutes,
+            sessions = sessions + excluded.sessions
+    """, [k + tuple(v) for k, v in totals.items()])
+    conn.executemany("UPDATE logs SET rolled_up = 1 WHERE id = ?", [(r["id"],) for r in sessions])
+
+def backfill_usage_rollups():
+    """roll up closed sessions missing from usage_daily, BACKFILL_BATCH_ROWS per transaction"""
+    last_id = 0
+    rolled = 0
+    while True:
+        conn = get_db()
+        try:
+            # a plain read first: with nothing left (every boot but the first) no write lock is taken
+            if conn.execute(ROLLUP_SESSIONS_SQL + " AND id > ? LIMIT 1", (last_id,)).fetchone() is None:
+                break
+            # IMMEDIATE: an unlock can't roll up the same session between the read and the flag
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(ROLLUP_SESSIONS_SQL + " AND id > ? ORDER BY id LIMIT ?",
+                                (last_id, BACKFILL_BATCH_ROWS)).fetchall()
+            rollup_sessions(conn, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        if rows:
+            last_id = rows[-1]["id"]
+            rolled += len(rows)
+        time.sleep(BACKFILL_PAUSE_SECONDS)
+    if rolled:
+        print(f"[DB] rolled up {rolled} past sessions into usage_daily")
+
+# ---------- cold log archive ----------
+# Completed, rolled-up sessions older than LOG_ARCHIVE_AFTER_DAYS move out of
+# logs into gzipped NDJSON segments under LOG_ARCHIVE_DIR, by start month:
+# logs-YYYY-MM.<segment>.ndjson.gz, one new segment per month per archive run.
+# Segments are written once and never rewritten, so no write lock is held for
+# the file work. Sessions of deleted devices are archived too (device_name
+# null), or they would sit in the hot table forever. Readers apply the hot
+# rows' JOIN rules: a record shows only while a device with its id exists,
+# under that device's current name; the stored name is just the one at archive time.
+ARCHIVE_FIELDS = ("id", "device_id", "device_name", "user", "start_time", "end_time", "minutes")
+ARCHIVE_SELECT = f"""
+    SELECT l.id, l.device_id, d.name AS device_name, l.user, l.start_time, l.end_time,
+           {LOG_MINUTES_SQL} AS minutes
+    FROM logs l
+    LEFT JOIN devices d ON d.id = l.device_id
+"""
+ARCHIVE_WHERE = " WHERE l.start_time >= ? AND l.start_time < ? AND l.end_time < ? AND l.rolled_up = 1"
+
+def _archive_segments(month=None):
+    """archive file names, all of them or just one month's"""
+    try:
+        names = os.listdir(LOG_ARCHIVE_DIR)
+    except FileNotFoundError:
+        return []
+    prefix = f"logs-{month}." if month else "logs-"
+    return sorted(n for n in names if n.startswith(prefix) and n.endswith(".ndjson.gz"))
+
+def archived_months(start_date="", end_date=""):
+    """YYYY-MM of the archived months overlapping [start_date, end_date], oldest first"""
+    months = sorted(set(n[5:12] for n in _archive_segments()))
+    return [m for m in months
+            if (not start_date or m >= start_date[:7]) and (not end_date or m <= end_date[:7])]
+
+def _next_month(month):
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+def _write_archive_segment(month, rows):
+    """a new segment for rows (already in start_time, id order): temp file, fsync, rename"""
+    path = os.path.join(LOG_ARCHIVE_DIR, f"logs-{month}.{uuid.uuid4().hex[:12]}.ndjson.gz")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for r in rows:
+                gz.write((json.dumps({k: r[k] for k in ARCHIVE_FIELDS}, separators=(",", ":")) + "\n").encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+def archive_logs(older_than_days=LOG_ARCHIVE_AFTER_DAYS):
+    """
+    Move old completed sessions to the archive; returns the number moved.
+    Month by month: the rows are read without a write lock, written as one
+    segment, then deleted in BACKFILL_BATCH_ROWS-sized IMMEDIATE transactions.
+    A crash before the delete, or a second archiver (the CLI) racing this one,
+    leaves a session in two places; readers drop the duplicate by id.
+    """
+    cutoff = (date.today() - timedelta(days=older_than_days)).isoformat()
+    os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+    moved = 0
+    month = ""
+    while True:
+        conn = get_db()
+        try:
+            first = conn.execute(
+                "SELECT MIN(l.start_time) AS s FROM logs l" + ARCHIVE_WHERE, (month, cutoff, cutoff)
+            ).fetchone()["s"]
+            if first is None:
+                break
+            month = first[:7]
+            rows = conn.execute(
+                ARCHIVE_SELECT + ARCHIVE_WHERE + " ORDER BY l.start_time ASC, l.id ASC",
+                (month, min(_next_month(month), cutoff), cutoff)
+            ).fetchall()
+        finally:
+            conn.close()
+        _write_archive_segment(month, rows)
+        month = _next_month(month)
+
+        ids = [(r["id"],) for r in rows]
+        for i in range(0, len(ids), BACKFILL_BATCH_ROWS):
+            conn = get_db()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("DELETE FROM logs WHERE id = ?", ids[i:i + BACKFILL_BATCH_ROWS])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            time.sleep(BACKFILL_PAUSE_SECONDS)
+        moved += len(rows)
+    if moved:
+        print(f"[DB] archived {moved} sessions older than {cutoff} to {LOG_ARCHIVE_DIR}/")
+    return moved
+
+def _read_archive_month(month):
+    """one month's records from all its segments, deduplicated, in (start_time, id) order"""
+    records = {}
+    for name in _archive_segments(month):
+        try:
+            with gzip.open(os.path.join(LOG_ARCHIVE_DIR, name), "rt", encoding="utf-8") as f:
+                for line in f:
+                    r = json.loads(line)
+                    records[r["id"]] = r
+        except FileNotFoundError:
+            continue
+    return sorted(records.values(), key=lambda r: (r["start_time"], r["id"]))
+
+def iter_archived_logs(start_date="", end_date=""):
+    """
+    archived rows whose start day is in [start_date, end_date], in (start_time,
+    id) order, named and filtered by the devices table like LOG_EXPORT_SELECT rows
+    """
+    months = archived_months(start_date, end_date)
+    if not months:
+        return
+    conn = get_db()
+    try:
+        names = dict(conn.execute("SELECT id, name FROM devices").fetchall())
+    finally:
+        conn.close()
+    for month in months:
+        for r in _read_archive_month(month):
+            day = r["start_time"][:10]
+            if (start_date and day < start_date) or (end_date and day > end_date):
+                continue
+            if r["device_id"] not in names:
+                continue
+            r["device_name"] = names[r["device_id"]]
+            r["day"] = day
+            r["start_hm"] = r["start_time"][11:16]
+            r["end_hm"] = r["end_time"][11:16]
+            yield r
+
+def merge_archived_logs(hot_rows, start_date="", end_date=""):
+    """
+    hot LOG_EXPORT_SELECT rows (start_time, id order) merged with the archive
+    for the same day range; rows present in both are yielded once
+    """
+    if not archived_months(start_date, end_date):
+        yield from hot_rows
+        return
+    last_id = None
+    for r in heapq.merge(hot_rows, iter_archived_logs(start_date, end_date),
+                         key=lambda r: (r["start_time"], r["id"])):
+        if r["id"] != last_id:
+            last_id = r["id"]
+            yield r
+
+def _run_backfills():
+    backfill_log_epochs()
+    backfill_usage_rollups()
+    archive_logs()  # after the rollups: only rolled-up sessions may leave the hot table
+
+def start_backfill():
+    threading.Thread(target=_run_backfills, name="backfill", daemon=True).start()
+
+def check_query_plans(conn):
+    """
+    (label, offending plan steps) for every hot query that stopped using its
+    index - empty when all are index-backed. init_db prints them; the test suite
+    fails on them.
+    """
+    checks = [
+        ("download_logs range",) + log_range_query("2000-01-01", "2000-01-31"),
+        ("unlock open session", OPEN_SESSION_SQL, (0,)),
+        ("history page", HISTORY_SQL, (HISTORY_NEWEST, HISTORY_LIMIT)),
+        ("rollup backfill", ROLLUP_SESSIONS_SQL + " AND id > ? ORDER BY id LIMIT ?", (0, BACKFILL_BATCH_ROWS)),
+        ("reservation overlap", RESERVATION_OVERLAP_SQL, {"device": 1, "start": 0, "end": 60}),
+    ]
+    # id order is the rowid walk itself; the other sorts and filters need their index
+    for sort in DEVICE_SORTS.keys() - {"id"}:
+        sql, _, params = device_page_sql(dict(DEVICE_VIEW_DEFAULTS, sort=sort))
+        checks.append((f"device table sorted by {sort}", sql, params))
+    for key, value in (("status", "In Use"), ("name", "A"), ("user", "A")):
+        sort = "id" if key == "status" else key
+        sql, _, params = device_page_sql(dict(DEVICE_VIEW_DEFAULTS, sort=sort, **{key: value}))
+        checks.append((f"device table filtered by {key}", sql, params))
+    failures = []
+    for label, sql, params in checks:
+        plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        bad = [p for p in plan
+               if "TEMP B-TREE" in p or (p.startswith("SCAN") and "USING" not in p)]
+        if bad:
+            failures.append((label, bad))
+    return failures
+
+def find_smallest_missing_id(conn):
+    """lowest id in the free list, else MAX(id) + 1 - two primary-key lookups"""
+    r = conn.execute("SELECT MIN(id) AS m FROM free_device_ids").fetchone()
+    if r["m"] is not None:
+        return r["m"]
+    return get_max_id(conn) + 1
+
+def get_max_id(conn):
+    cur = conn.execute("SELECT MAX(id) as m FROM devices")
+    r = cur.fetchone()
+    return r["m"] or 0
+
+# ---------- bulk device import ----------
+def parse_device_names(text, fmt):
+    """
+    Device names from an import payload. fmt is "json" (a list of names, of
+    {"name": ...} objects, or {"names": [...]}) or "csv" (a "name" column if
+    the header has one, else the first column). Raises ValueError.
+    """
+    if fmt == "json":
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("names", data.get("devices"))
+        if not isinstance(data, list):
+            raise ValueError("expected a JSON list of device names")
+        return [item.get("name") if isinstance(item, dict) else item for item in data]
+
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [h.strip().lower() for h in rows[0]]
+    if "name" in header:
+        col = header.index("name")
+        return [r[col] if col < len(r) else "" for r in rows[1:]]
+    return [r[0] if r else "" for r in rows]
+
+def import_devices(names):
+    """
+    Add one device per name in a single transaction, ids handed out
+    smallest-free-first exactly like /add. Returns (results, elapsed seconds);
+    each result has the 1-based row number and either the new id or an error.
+    """
+    started = time.perf_counter()
+    results = []
+    valid = []
+    for row_no, raw in enumerate(names, start=1):
+        if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+            raw = str(raw)  # a bare JSON number, e.g. [5] or {"name": 7}
+        elif raw is not None and not isinstance(raw, str):
+            results.append({"row": row_no, "name": raw, "error": "name must be a string"})
+            continue
+        name = (raw or "").strip()
+        if not name:
+            results.append({"row": row_no, "name": raw, "error": "empty name"})
+            continue
+        entry = {"row": row_no, "name": name}
+        results.append(entry)
+        valid.append(entry)
+
+    if valid:
+        conn = get_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            free = [r["id"] for r in conn.execute(
+                "SELECT id FROM free_device_ids ORDER BY id LIMIT ?", (len(valid),))]
+            next_id = get_max_id(conn) + 1
+            for i, entry in enumerate(valid):
+                if i < len(free):
+                    entry["id"] = free[i]
+                else:
+                    entry["id"] = next_id
+                    next_id += 1
+            conn.executemany("INSERT INTO devices (id, name) VALUES (?, ?)",
+                             [(e["id"], e["name"]) for e in valid])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return results, time.perf_counter() - started
+
+def import_summary(results, elapsed):
+    imported = sum(1 for r in results if "id" in r)
+    return {
+        "imported": imported,
+        "failed": len(results) - imported,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "rows_per_sec": round(imported / elapsed) if elapsed > 0 else None,
+        "results": results,
+    }
+
+def conflict_response(message, status=409):
+    """a lost lock/unlock race: JSON for API clients, a short page for browser form posts"""
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        return jsonify({"error": message}), status
+    page = f"<p>{escape(message)}</p><p><a href=\"{url_for('index')}\">Back to dashboard</a></p>"
+    return make_response((page, status))
+
+def retry_on_busy(view):
+    """
+    Re-run a write route that failed with SQLITE_BUSY, with jittered backoff.
+    busy_timeout already waits for the lock; this covers what it can't (the wait
+    running out under load from several processes). Only for routes that write
+    in one transaction and do their side effects after the commit.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        for attempt in range(DB_BUSY_RETRIES + 1):
+            try:
+                return view(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+            time.sleep(DB_BUSY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+        response = make_response(conflict_response("The database is busy, try again.", 503))
+        response.headers["Retry-After"] = "1"
+        return response
+    return wrapper
+
+def parse_eta(eta, now):
+    """ETA datetime if eta is ISO and within [now, now + 30 days], else None"""
+    try:
+        eta_dt = datetime.fromisoformat(eta)
+    except Exception:
+        return None
+    max_allowed = now + timedelta(days=30)
+    if eta_dt < now or eta_dt > max_allowed:
+        return None
+    return eta_dt
+
+OPEN_SESSION_SQL = """
+    SELECT id FROM logs
+    WHERE device_id = ? AND end_time IS NULL
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+def normalize_log_range(start_date, end_date):
+    """
+    Both bounds as YYYY-MM-DD ('' stays open). date.fromisoformat also takes
+    forms like 20250201, and the archive month names, the export cache key and
+    the log_day_changes stamp compare these as plain strings. Raises ValueError.
+    """
+    return tuple(date.fromisoformat(d).isoformat() if d else "" for d in (start_date, end_date))
+
+def log_range_where(start_date, end_date):
+    """
+    WHERE clause + params for logs whose start day lies in [start_date, end_date].
+    start_time is ISO text, so the day bounds are plain string comparisons the
+    idx_logs_start_time index can serve (no date() around the column).
+    Raises ValueError on a malformed date.
+    """
+    where = []
+    params = []
+    if start_date:
+        where.append("l.start_time >= ?")
+        params.append(date.fromisoformat(start_date).isoformat())
+    if end_date:
+        where.append("l.start_time < ?")
+        params.append((date.fromisoformat(end_date) + timedelta(days=1)).isoformat())
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+def log_range_query(start_date, end_date):
+    """LOG_EXPORT_SELECT for [start_date, end_date] in export order; raises ValueError"""
+    where, params = log_range_where(start_date, end_date)
+    return LOG_EXPORT_SELECT + where + " ORDER BY l.start_time ASC, l.id ASC", params
+
+DEVICE_COLUMNS_SQL = """
+    SELECT id, name, status, current_user, eta, eta_ts
+    FROM devices
+"""
+
+# ---------- device table views (filter / sort / page) ----------
+DEVICE_STATUSES = ("Available", "In Use")
+# sort key -> ORDER BY expression; each one matches an index from _migration_device_indexes
+DEVICE_SORTS = {
+    "id": "id",
+    "name": "name COLLATE NOCASE",
+    "status": "status",
+    "user": "current_user COLLATE NOCASE",
+    "eta": "eta_ts",
+}
+
+DEVICE_VIEW_DEFAULTS = {"status": "", "name": "", "user": "", "sort": "id", "dir": "asc",
+                        "page": 1, "page_size": DEVICE_PAGE_SIZE}
+
+def device_view(args, page_size=DEVICE_PAGE_SIZE):
+    """
+    Normalised ?status=&name=&user=&sort=&dir=&page=&page_size= from a request;
+    unknown values fall back to the defaults. page_size=None means no paging.
+    """
+    status = args.get("status", "")
+    sort = args.get("sort", "id")
+    size = args.get("page_size", page_size, type=int)
+    return {
+        "status": status if status in DEVICE_STATUSES else "",
+        "name": args.get("name", "").strip(),
+        "user": args.get("user", "").strip(),
+        "sort": sort if sort in DEVICE_SORTS else "id",
+        "dir": "desc" if args.get("dir") == "desc" else "asc",
+        "page": max(args.get("page", 1, type=int), 1),
+        "page_size": None if size is None else min(max(size, 1), DEVICE_PAGE_MAX),
+    }
+
+def device_view_args(view, **changes):
+    """query-string arguments for a view, defaults left out"""
+    view = dict(view, **changes)
+    return {k: v for k, v in view.items() if v != DEVICE_VIEW_DEFAULTS[k]}
+
+def device_view_key(view):
+    """short stable id for a view - render cache key and ETag part (filters are free text)"""
+    return hashlib.sha1(json.dumps(view, sort_keys=True).encode()).hexdigest()[:16]
+
+def device_filter_sql(view):
+    """WHERE clause + params; name/user are case-insensitive prefix matches kept as index ranges"""
+    where, params = [], []
+    if view["status"]:
+        where.append("status = ?")
+        params.append(view["status"])
+    for key, column in (("name", "name"), ("user", "current_user")):
+        if view[key]:
+            # prefix <= value < prefix + highest code point, same rows as LIKE 'prefix%'
+            where.append(f"{column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE")
+            params += [view[key], view[key] + "\U0010ffff"]
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+def device_page_sql(view):
+    """(rows sql, count sql, filter params) for a view"""
+    where, params = device_filter_sql(view)
+    direction = view["dir"].upper()
+    order = DEVICE_SORTS[view["sort"]] + " " + direction
+    if view["sort"] != "id":
+        order += f", id {direction}"  # stable order between pages
+    return (DEVICE_COLUMNS_SQL + where + " ORDER BY " + order,
+            "SELECT COUNT(*) AS n FROM devices" + where, params)
+
+def device_page(conn, view):
+    """one page of device rows for a view, plus the totals the pager needs"""
+    sql, count_sql, params = device_page_sql(view)
+    size = view["page_size"]
+    total = conn.execute(count_sql, params).fetchone()["n"]
+    if size is None:
+        pages, page = 1, 1
+        rows = conn.execute(sql, params).fetchall()
+    else:
+        pages = max((total + size - 1) // size, 1)
+        page = min(view["page"], pages)
+        rows = conn.execute(sql + " LIMIT ? OFFSET ?",
+                            params + [size, (page - 1) * size]).fetchall()
+    return {
+        "devices": [device_dict(r) for r in rows],
+        "total": total,
+        "page": page,
+        "pages": pages,
+        "view": dict(view, page=page),
+    }
+
+def device_dict(row):
+    d = dict(row)
+    d['eta_display'] = format_eta_display(d['eta']) if d.get('eta') else '-'
+    d['eta_status'] = eta_status_of(d)
+    return d
+
+# keyset page: newest first, strictly older than the cursor id (walks the rowid, no OFFSET)
+HISTORY_SQL = f"""
+    SELECT l.id, l.device_id, d.name AS device_name,
+           l.user, l.start_time, l.end_time,
+           {LOG_MINUTES_SQL} AS minutes
+    FROM logs l
+    JOIN devices d ON d.id = l.device_id
+    WHERE l.id < ?
+    ORDER BY l.id DESC
+    LIMIT ?
+"""
+HISTORY_NEWEST = 2 ** 63 - 1  # before_id meaning "from the newest row"
+
+def history_row(r):
+    l = dict(r)
+    minutes = l.pop("minutes")
+    l['start_display'] = format_eta_display(l['start_time'])
+    if l['end_time']:
+        l['end_display'] = format_eta_display(l['end_time'])
+        l['duration'] = format_minutes(minutes)
+        l['is_ongoing'] = False
+    else:
+        l['end_display'] = "Ongoing"
+        l['duration'] = "-"
+        l['is_ongoing'] = True
+    return l
+
+# ---------- reservations ----------
+# every booking overlapping [start, end) on one device: the last one starting at or
+# before :start (the only earlier one that can reach into the window, as bookings
+# never overlap) plus those starting inside it - two range seeks on device_start
+RESERVATION_OVERLAP_SQL = """
+    SELECT id, device_id, user, start_time, end_time, start_ts, end_ts
+    FROM reservations
+    WHERE device_id = :device AND start_ts < :end AND end_ts > :start
+      AND start_ts >= COALESCE((SELECT start_ts FROM reservations
+                                WHERE device_id = :device AND start_ts <= :start
+                                ORDER BY start_ts DESC LIMIT 1), :start)
+    ORDER BY start_ts
+"""
+
+# earliest gap of at least :minutes starting at or after :after on any device.
+# Busy time is future bookings plus a lock's [now, ETA) - a lock past its ETA (or
+# without one) has no known end, so it holds the device to the booking horizon.
+# Running MAX(end) over the earlier intervals gives each interval's preceding free edge
+NEXT_FREE_SLOT_SQL = """
+    WITH busy AS (
+        SELECT device_id, start_ts, end_ts FROM reservations WHERE end_ts > :after
+        UNION ALL
+        SELECT id, :after, CASE WHEN eta_ts > :now THEN eta_ts ELSE :horizon END FROM devices
+        WHERE status = 'In Use'
+    ),
+    edges AS (
+        SELECT device_id, start_ts,
+               MAX(end_ts) OVER (PARTITION BY device_id ORDER BY start_ts
+                                 ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS prev_end
+        FROM busy
+    ),
+    last AS (
+        SELECT device_id, MAX(end_ts) AS last_end FROM busy GROUP BY device_id
+    ),
+    gaps AS (
+        -- the free stretch before each busy interval
+        SELECT device_id, MAX(COALESCE(prev_end, :after), :after) AS free_from, start_ts AS free_to
+        FROM edges
+        UNION ALL
+        -- open ended: after a device's last busy interval, or from :after if it has none
+        SELECT d.id, MAX(COALESCE(last.last_end, :after), :after), NULL
+        FROM devices d
+        LEFT JOIN last ON last.device_id = d.id
+    )
+    SELECT g.device_id, d.name AS device_name, g.free_from, g.free_to
+    FROM gaps g
+    JOIN devices d ON d.id = g.device_id
+    WHERE (g.free_to IS NULL OR g.free_to - g.free_from >= :minutes * 60)
+      AND g.free_from + :minutes * 60 <= :horizon
+    ORDER BY g.free_from, g.device_id
+    LIMIT 1
+"""
+
+def reservation_conflicts(conn, device_id, start_ts, end_ts):
+    return conn.execute(RESERVATION_OVERLAP_SQL,
+                        {"device": device_id, "start": start_ts, "end": end_ts}).fetchall()
+
+def parse_booking_time(value):
+    """minute-precision datetime from ISO text, None if malformed"""
+    try:
+        return datetime.fromisoformat(str(value)).replace(second=0, microsecond=0)
+    except ValueError:
+        return None
+
+def reservation_dict(row):
+    r = dict(row)
+    r["start_display"] = format_eta_display(r["start_time"])
+    r["end_display"] = format_eta_display(r["end_time"])
+    return r
+
+# ---------- state version (ETags) ----------
+# bumped by every write route; ETags embed it so clients can poll with If-None-Match
+_state_version = 0
+_state_lock = threading.Lock()
+_shared_version = None  # multiprocessing.Value shared by all processes under serve
+_boot_id = format(int(time.time() * 1000), "x")  # keeps ETags from colliding across restarts
+
+def state_version():
+    return _shared_version.value if _shared_version is not None else _state_version
+
+def bump_state_version():
+    global _state_version
+    if _shared_version is not None:
+        with _shared_version.get_lock():
+            _shared_version.value += 1
+            return _shared_version.value
+    with _state_lock:
+        _state_version += 1
+        return _state_version
+
+def state_etag(*parts):
+    return "-".join([_boot_id, str(state_version())] + [str(p) for p in parts])
+
+def conditional_json(etag, build):
+    """304 when the client already has etag, otherwise jsonify(build()) tagged with it"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# ---------- live events (Server-Sent Events) ----------
+_subscribers = set()
+_async_subscribers = {}  # event loop -> set of asyncio.Queue, for /events streams served by asgi_app
+_subscribers_lock = threading.Lock()
+
+def subscribe_events():
+    q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+    with _subscribers_lock:
+        _subscribers.add(q)
+    return q
+
+def unsubscribe_events(q):
+    with _subscribers_lock:
+        _subscribers.discard(q)
+
+def subscribe_async_events(loop):
+    q = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    with _subscribers_lock:
+        _async_subscribers.setdefault(loop, set()).add(q)
+    return q
+
+def unsubscribe_async_events(loop, q):
+    with _subscribers_lock:
+        subs = _async_subscribers.get(loop)
+        if subs is not None:
+            subs.discard(q)
+            if not subs:
+                del _async_subscribers[loop]
+
+def async_subscribed(loop, q):
+    with _subscribers_lock:
+        return q in _async_subscribers.get(loop, ())
+
+def _fan_out_async(loop, subs, message):
+    """runs on the event loop: one wake-up per loop however many streams it holds"""
+    for q in subs:
+        try:
+            q.put_nowait(message)
+        except asyncio.QueueFull:
+            unsubscribe_async_events(loop, q)
+
+def event_message(version, kind, data):
+    return f"id: {version}\nevent: {kind}\ndata: {data}\n\n"
+
+def publish_event(kind, payload):
+    if _shared_version is not None:
+        # several processes: the events table carries it to the streams held by every worker
+        conn = get_db()
+        try:
+            conn.execute("INSERT INTO events (version, kind, payload) VALUES (?, ?, ?)",
+                         (state_version(), kind, json.dumps(payload)))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[EVENTS] dropped {kind} event:", e)  # the write itself is committed; clients resync on reconnect
+        finally:
+            conn.close()
+        return
+    deliver_event(event_message(state_version(), kind, json.dumps(payload)))
+
+def deliver_event(message):
+    """hand an SSE message to the /events streams of this process"""
+    with _subscribers_lock:
+        subs = list(_subscribers)
+        async_subs = [(loop, list(qs)) for loop, qs in _async_subscribers.items()]
+    for q in subs:
+        try:
+            q.put_nowait(message)
+        except queue.Full:
+            # too far behind to patch rows reliably; drop it, the browser reconnects and resyncs
+            unsubscribe_events(q)
+    for loop, qs in async_subs:
+        try:
+            loop.call_soon_threadsafe(_fan_out_async, loop, qs, message)
+        except RuntimeError:  # loop already closed
+            with _subscribers_lock:
+                _async_subscribers.pop(loop, None)
+
+def _event_relay():
+    """HTTP worker thread under serve: feed events published by any process to local streams"""
+    conn = get_db()
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) AS m FROM events").fetchone()["m"]
+    conn.close()
+    while True:
+        time.sleep(WORKER_POLL_SECONDS)
+        conn = get_db()
+        try:
+            rows = conn.execute("SELECT id, version, kind, payload FROM events WHERE id > ? ORDER BY id",
+                                (last_id,)).fetchall()
+        except sqlite3.Error as e:
+            print("[EVENTS] relay read failed:", e)
+            continue
+        finally:
+            conn.close()
+        for r in rows:
+            deliver_event(event_message(r["version"], r["kind"], r["payload"]))
+        if rows:
+            last_id = rows[-1]["id"]
+
+def prune_event_log(conn):
+    conn.execute("DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (EVENT_LOG_KEEP,))
+    conn.commit()
+
+def device_event_payload(conn, device_id):
+    row = conn.execute(DEVICE_COLUMNS_SQL + " WHERE id = ?", (device_id,)).fetchone()
+    if row is None:
+        return {"id": device_id}
+    return device_dict(row)
+
+def publish_device_event(kind, device_id):
+    conn = get_db()
+    try:
+        payload = device_event_payload(conn, device_id)
+    finally:
+        conn.close()
+    publish_event(kind, payload)
+
+# ---------- ETA scheduler ----------
+# min-heap of (eta_ts, device_id) for in-use devices; a background thread sleeps
+# until the earliest ETA, moves the device into _overdue and publishes "overdue"
+_eta_heap = []
+_eta_due = {}  # device_id -> eta_ts it is scheduled for; heap entries that disagree are stale
+_overdue = {}  # device_id -> eta_ts that has passed
+_eta_cond = threading.Condition()
+_eta_thread = None
+
+def schedule_eta(device_id, eta_ts):
+    """(re)arm a device's ETA after a lock; eta_ts None disarms it after an unlock"""
+    with _eta_cond:
+        _overdue.pop(device_id, None)
+        if eta_ts is None:
+            _eta_due.pop(device_id, None)
+            return
+        _eta_due[device_id] = eta_ts
+        heapq.heappush(_eta_heap, (eta_ts, device_id))
+        if len(_eta_heap) > 2 * len(_eta_due) + 64:
+            # unlocks leave their entries behind; drop them before the heap bloats
+            _eta_heap[:] = [(ts, i) for i, ts in _eta_due.items()]
+            heapq.heapify(_eta_heap)
+        if _eta_heap[0] == (eta_ts, device_id):
+            _eta_cond.notify()  # new earliest deadline, wake the sleeper to shorten its wait
+
+def cancel_eta(device_id):
+    schedule_eta(device_id, None)
+
+def seed_eta_scheduler():
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT id, eta_ts FROM devices WHERE status = 'In Use' AND eta_ts IS NOT NULL"
+    ).fetchall()
+    conn.close()
+    with _eta_cond:
+        _overdue.clear()
+        _eta_due.clear()
+        _eta_due.update((r["id"], r["eta_ts"]) for r in rows)
+        _eta_heap[:] = [(ts, i) for i, ts in _eta_due.items()]
+        heapq.heapify(_eta_heap)
+        _eta_cond.notify()
+
+def sync_eta_scheduler():
+    """
+    Bring the heap in line with the devices table without re-firing ETAs that
+    already passed - for a scheduler whose locks and unlocks ran in other
+    processes (the housekeeper under serve).
+    """
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT id, eta_ts FROM devices WHERE status = 'In Use' AND eta_ts IS NOT NULL"
+    ).fetchall()
+    conn.close()
+    current = {r["id"]: r["eta_ts"] for r in rows}
+    with _eta_cond:
+        for device_id in (_eta_due.keys() | _overdue.keys()) - current.keys():
+            cancel_eta(device_id)
+        for device_id, eta_ts in current.items():
+            if _eta_due.get(device_id) != eta_ts and _overdue.get(device_id) != eta_ts:
+                schedule_eta(device_id, eta_ts)
+
+def _due_etas():
+    """block until at least one ETA passes (or the scheduler stops); caller holds _eta_cond"""
+    while _eta_thread is not None:
+        now = time.time()
+        fired = []
+        while _eta_heap and _eta_heap[0][0] <= now:
+            eta_ts, device_id = heapq.heappop(_eta_heap)
+            if _eta_due.get(device_id) == eta_ts:
+                del _eta_due[device_id]
+                _overdue[device_id] = eta_ts
+                fired.append(device_id)
+        if fired:
+            return fired
+        _eta_cond.wait(_eta_heap[0][0] - now if _eta_heap else None)
+    return []
+
+def _eta_worker():
+    while True:
+        with _eta_cond:
+            fired = _due_etas()
+        if not fired:
+            return
+        bump_state_version()  # cached pages and ETags carry the old badge
+        for device_id in fired:
+            publish_device_event("overdue", device_id)
+
+def start_eta_scheduler():
+    global _eta_thread
+    if _eta_thread is not None:
+        return
+    seed_eta_scheduler()
+    with _eta_cond:
+        _eta_thread = threading.Thread(target=_eta_worker, name="eta-scheduler", daemon=True)
+    _eta_thread.start()
+    atexit.register(stop_eta_scheduler)
+
+def stop_eta_scheduler():
+    global _eta_thread
+    with _eta_cond:
+        thread, _eta_thread = _eta_thread, None
+        _eta_cond.notify()
+    if thread is not None:
+        thread.join()
+
+def eta_status_of(d):
+    """"Passed" / "Active" badge for a device row - a dict lookup, no clock or date parsing"""
+    if d['status'] != 'In Use' or d.get('eta_ts') is None:
+        return ''
+    if _eta_thread is None:
+        # scheduler not running (CLI import, scripts): fall back to the clock
+        return 'Passed' if d['eta_ts'] <= time.time() else 'Active'
+    return 'Passed' if _overdue.get(d['id']) == d['eta_ts'] else 'Active'
+
+# ---------- render cache ----------
+# formatted device pages for the dashboard, valid while the state version is unchanged
+_render_cache = (None, {})  # (version, {view key: device page})
+_render_stats_lock = threading.Lock()
+render_cache_stats = {"hits": 0, "misses": 0}
+
+def dashboard_model(view):
+    global _render_cache
+    version = state_version()
+    key = device_view_key(view)
+    cached_version, pages = _render_cache
+    if cached_version == version and key in pages:
+        with _render_stats_lock:
+            render_cache_stats["hits"] += 1
+        return pages[key]
+
+    conn = get_db()
+    try:
+        page = device_page(conn, view)
+    finally:
+        conn.close()
+
+    # keyed by the version read before querying: a write racing this render
+    # bumps past it, so the next request misses and rebuilds
+    if cached_version != version or len(pages) >= DEVICE_VIEW_CACHE_MAX:
+        pages = {}
+    pages[key] = page
+    _render_cache = (version, pages)
+    with _render_stats_lock:
+        render_cache_stats["misses"] += 1
+    return page
+
+# ---------- routes ----------
+@app.route("/")
+def index():
+    page = dashboard_model(device_view(request.args))
+
+    today = datetime.now().date().isoformat()
+    host_flag = is_request_from_host()
+    return render_dashboard(
+        devices=page["devices"],
+        page=page,
+        view=page["view"],
+        statuses=DEVICE_STATUSES,
+        view_defaults=DEVICE_VIEW_DEFAULTS,
+        download_formats=download_format_choices(),
+        refresh_ms=REFRESH_MS,
+        today=today,
+        is_host=host_flag,
+        urls=dashboard_urls()
+    )
+
+@app.route("/lock/<int:device_id>", methods=["POST"])
+@retry_on_busy
+def lock_device(device_id):
+    user = request.form.get('user', '').strip().upper()
+    eta = request.form.get('eta', '').strip()
+    if not user or not eta:
+        return redirect(url_for('index'))
+
+    now = datetime.now()
+    eta_dt = parse_eta(eta, now)
+    if eta_dt is None:
+        return redirect(url_for('index'))
+
+    conn = get_db()
+    # compare-and-set: only one of several concurrent lockers can flip Available -> In Use
+    cur = conn.execute("""
+        UPDATE devices SET status='In Use', current_user=?, eta=?, eta_ts=?
+        WHERE id=? AND status='Available'
+    """, (user, eta, epoch_minutes(eta_dt), device_id))
+    if cur.rowcount != 1:
+        conn.rollback()
+        row = conn.execute("SELECT status, current_user FROM devices WHERE id=?", (device_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return conflict_response(f"Device {device_id} does not exist.", 404)
+        return conflict_response(f"Device {device_id} is already locked by {row['current_user'] or 'someone else'}.")
+    # [now, ETA) must not run into somebody else's booking; the holder may lock through their own
+    clash = [r for r in reservation_conflicts(conn, device_id, epoch_minutes(now), epoch_minutes(eta_dt))
+             if r["user"] != user]
+    if clash:
+        conn.rollback()
+        conn.close()
+        return conflict_response(f"Device {device_id} is reserved by {clash[0]['user']} "
+                                 f"from {format_eta_display(clash[0]['start_time'])}.")
+    conn.execute(
+        "INSERT INTO logs (device_id, user, start_time, start_ts) VALUES (?, ?, ?, ?)",
+        (device_id, user, now.isoformat(timespec='minutes'), epoch_minutes(now))
+    )
+    conn.commit()
+    conn.close()
+
+    schedule_eta(device_id, epoch_minutes(eta_dt))
+    bump_state_version()
+    publish_device_event("lock", device_id)
+    request_log_export()
+    return redirect(url_for('index'))
+
+@app.route("/unlock/<int:device_id>", methods=["POST"])
+@retry_on_busy
+def unlock_device(device_id):
+    now = datetime.now()
+    conn = get_db()
+    cur = conn.execute("""
+        UPDATE devices SET status='Available', current_user=NULL, eta=NULL, eta_ts=NULL
+        WHERE id=? AND status='In Use'
+    """, (device_id,))
+    if cur.rowcount != 1:
+        conn.rollback()
+        exists = conn.execute("SELECT 1 FROM devices WHERE id=?", (device_id,)).fetchone()
+        conn.close()
+        if exists is None:
+            return conflict_response(f"Device {device_id} does not exist.", 404)
+        return conflict_response(f"Device {device_id} is not locked.")
+    session = conn.execute(OPEN_SESSION_SQL, (device_id,)).fetchone()
+    if session is not None:
+        conn.execute("UPDATE logs SET end_time = ?, end_ts = ? WHERE id = ?",
+                     (now.isoformat(timespec='minutes'), epoch_minutes(now), session["id"]))
+        rollup_sessions(conn, conn.execute(ROLLUP_SESSIONS_SQL + " AND id = ?",
+                                           (session["id"],)).fetchall())
+    conn.commit()
+    conn.close()
+
+    cancel_eta(device_id)
+    bump_state_version()
+    publish_device_event("unlock", device_id)
+    request_log_export()
+    return redirect(url_for('index'))
+
+@app.route("/api/batch/<action>", methods=["POST"])
+@retry_on_busy
+def api_batch(action):
+    """
+    Lock or unlock several devices in one transaction.
+    JSON body: {"device_ids": [...], "user": ..., "eta": ... (lock only),
+                "all_or_nothing": false}
+    """
+    if action not in ("lock", "unlock"):
+        return jsonify({"error": "action must be lock or unlock"}), 404
+    body = request.get_json(silent=True) or {}
+    ids = []
+    for raw in body.get("device_ids") or []:
+        try:
+            device_id = int(raw)
+        except (TypeError, ValueError):
+            return jsonify({"error": f"bad device id {raw!r}"}), 400
+        if device_id not in ids:
+            ids.append(device_id)
+    if not ids:
+        return jsonify({"error": "device_ids is required"}), 400
+    if len(ids) > BATCH_MAX_DEVICES:
+        return jsonify({"error": f"at most {BATCH_MAX_DEVICES} devices per batch"}), 400
+
+    now = datetime.now()
+    now_str = now.isoformat(timespec='minutes')
+    if action == "lock":
+        user = str(body.get("user") or "").strip().upper()
+        eta = str(body.get("eta") or "").strip()
+        eta_dt = parse_eta(eta, now) if user and eta else None
+        if eta_dt is None:
+            return jsonify({"error": "user and an eta within the next 30 days are required"}), 400
+        want = "Available"
+    else:
+        want = "In Use"
+
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        marks = ",".join("?" * len(ids))
+        status = {r["id"]: r["status"] for r in conn.execute(
+            f"SELECT id, status FROM devices WHERE id IN ({marks})", ids)}
+        ok = [i for i in ids if status.get(i) == want]
+        failed = [{"id": i, "error": "not found" if i not in status else f"already {status[i]}"}
+                  for i in ids if status.get(i) != want]
+        if action == "lock":
+            for i in list(ok):
+                clash = [r for r in reservation_conflicts(conn, i, epoch_minutes(now), epoch_minutes(eta_dt))
+                         if r["user"] != user]
+                if clash:
+                    ok.remove(i)
+                    failed.append({"id": i, "error": f"reserved by {clash[0]['user']} from {clash[0]['start_time']}"})
+        if failed and body.get("all_or_nothing"):
+            conn.rollback()
+            return jsonify({"action": action, "succeeded": [], "failed": failed}), 409
+
+        if action == "lock":
+            conn.executemany(
+                "UPDATE devices SET status='In Use', current_user=?, eta=?, eta_ts=? WHERE id=?",
+                [(user, eta, epoch_minutes(eta_dt), i) for i in ok])
+            conn.executemany(
+                "INSERT INTO logs (device_id, user, start_time, start_ts) VALUES (?, ?, ?, ?)",
+                [(i, user, now_str, epoch_minutes(now)) for i in ok])
+        else:
+            conn.executemany(
+                "UPDATE devices SET status='Available', current_user=NULL, eta=NULL, eta_ts=NULL WHERE id=?",
+                [(i,) for i in ok])
+            sessions = [r["id"] for r in (conn.execute(OPEN_SESSION_SQL, (i,)).fetchone() for i in ok) if r]
+            conn.executemany("UPDATE logs SET end_time = ?, end_ts = ? WHERE id = ?",
+                             [(now_str, epoch_minutes(now), sid) for sid in sessions])
+            if sessions:
+                rollup_sessions(conn, conn.execute(
+                    ROLLUP_SESSIONS_SQL + f" AND id IN ({','.join('?' * len(sessions))})",
+                    sessions).fetchall())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    if ok:
+        for i in ok:
+            if action == "lock":
+                schedule_eta(i, epoch_minutes(eta_dt))
+            else:
+                cancel_eta(i)
+        bump_state_version()
+        for i in ok:
+            publish_device_event(action, i)
+        request_log_export()
+    return jsonify({"action": action, "succeeded": ok, "failed": failed})
+
+def reused_ids_have_logs(device_ids):
+    """
+    True if an earlier device with one of these ids left sessions, hot or
+    archived: they join the new device in a full export, which the incremental
+    logs.csv sync can't express. Every archived session was rolled up first and
+    usage_daily is never pruned, so its device index answers for the archive.
+    """
+    if not device_ids:
+        return False
+    conn = get_db()
+    try:
+        # an import can reuse more ids than SQLite takes bound parameters
+        ids = json.dumps(list(device_ids))
+        return conn.execute("""
+            SELECT 1 FROM logs WHERE device_id IN (SELECT value FROM json_each(:ids))
+            UNION ALL
+            SELECT 1 FROM usage_daily WHERE device_id IN (SELECT value FROM json_each(:ids))
+            LIMIT 1
+        """, {"ids": ids}).fetchone() is not None
+    finally:
+        conn.close()
+
+@app.route("/add", methods=["POST"])
+def add_device():
+    name = request.form.get('name', '').strip()
+    if not name:
+        return redirect(url_for('index'))
+
+    added_id = None
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        new_id = find_smallest_missing_id(conn)
+        conn.execute("INSERT OR IGNORE INTO devices (id, name) VALUES (?, ?)", (new_id, name))
+        added_id = new_id
+        cur = conn.execute("SELECT 1 FROM devices WHERE id=?", (new_id,))
+        if not cur.fetchone():
+            # explicit MAX(id) + 1: an AUTOINCREMENT id could skip ids the free list never learns of
+            added_id = get_max_id(conn) + 1
+            conn.execute("INSERT INTO devices (id, name) VALUES (?, ?)", (added_id, name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        added_id = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            added_id = get_max_id(conn) + 1
+            conn.execute("INSERT INTO devices (id, name) VALUES (?, ?)", (added_id, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            added_id = None
+    finally:
+        conn.close()
+    bump_state_version()
+    if added_id:
+        publish_device_event("add", added_id)
+        if reused_ids_have_logs([added_id]):
+            request_log_rebuild()
+    return redirect(url_for('index'))
+
+@app.route("/edit/<int:device_id>", methods=["POST"])
+@retry_on_busy
+def edit_device(device_id):
+    if not is_request_from_host():
+        return redirect(url_for('index'))
+    name = request.form.get('name', '').strip()
+    if not name:
+        return redirect(url_for('index'))
+    conn = get_db()
+    conn.execute("UPDATE devices SET name=? WHERE id=?", (name, device_id))
+    conn.commit()
+    conn.close()
+    bump_state_version()
+    publish_device_event("edit", device_id)
+    request_log_rebuild()  # the name is on every past row of the device
+    return redirect(url_for('index'))
+
+@app.route("/delete/<int:device_id>", methods=["POST"])
+@retry_on_busy
+def delete_device(device_id):
+    if not is_request_from_host():
+        return redirect(url_for('index'))
+    conn = get_db()
+    cur = conn.execute("SELECT status FROM devices WHERE id=?", (device_id,))
+    row = cur.fetchone()
+    if not row:
+        conn.close()
+        return redirect(url_for('index'))
+    if row["status"] == "In Use":
+        conn.close()
+        return redirect(url_for('index'))
+    conn.execute("DELETE FROM devices WHERE id=?", (device_id,))
+    conn.commit()
+    conn.close()
+    cancel_eta(device_id)
+    bump_state_version()
+    publish_event("delete", {"id": device_id})
+    request_log_rebuild()  # the device's rows leave the file, later serials shift
+    return redirect(url_for('index'))
+
+@app.route("/recover", methods=["POST"])
+def recover():
+    if not is_request_from_host():
+        return redirect(url_for('index'))
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        max_id = get_max_id(conn)
+        if max_id < 1:
+            conn.execute("INSERT INTO devices (id, name, status) VALUES (?, ?, ?)", (1, "Device 1", "Available"))
+            conn.commit()
+            bump_state_version()
+            publish_device_event("add", 1)
+            if reused_ids_have_logs([1]):
+                request_log_rebuild()
+            return redirect(url_for('index'))
+        # the free list holds exactly the gaps below max_id; the insert trigger empties it
+        conn.execute("""
+            INSERT OR IGNORE INTO devices (id, name, status)
+            SELECT id, 'Device ' || id, 'Available' FROM free_device_ids
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+    finally:
+        conn.close()
+    bump_state_version()
+    publish_event("recover", {})  # possibly many rows - clients resync from /api/devices
+    request_log_rebuild()  # recovered ids are freed ones, their old sessions join again
+    return redirect(url_for('index'))
+
+@app.route("/api/devices/import", methods=["POST"])
+def api_import_devices():
+    """body: JSON names, a CSV body, or a multipart "file" upload (.csv / .json)"""
+    if not is_request_from_host():
+        return jsonify({"error": "host only"}), 403
+    upload = request.files.get("file")
+    if upload is not None:
+        try:
+            text = upload.read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return jsonify({"error": "upload must be UTF-8 text"}), 400
+        fmt = "json" if (upload.filename or "").lower().endswith(".json") else "csv"
+    else:
+        text = request.get_data(as_text=True)
+        fmt = "json" if request.is_json else "csv"
+    try:
+        names = parse_device_names(text, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(names) > IMPORT_MAX_ROWS:
+        return jsonify({"error": f"at most {IMPORT_MAX_ROWS} devices per import"}), 400
+
+    results, elapsed = import_devices(names)
+    summary = import_summary(results, elapsed)
+    if summary["imported"]:
+        bump_state_version()
+        publish_event("import", {"count": summary["imported"]})
+        if reused_ids_have_logs([r["id"] for r in results if "id" in r]):
+            request_log_rebuild()
+    return jsonify(summary)
+
+@app.route("/admin/rebuild_logs", methods=["POST"])
+def rebuild_logs():
+    if not is_request_from_host():
+        return redirect(url_for('index'))
+    request_log_rebuild(inline=True)
+    return redirect(url_for('index'))
+
+@app.route("/api/devices")
+def api_devices():
+    # without ?page_size= the whole table comes back, as before paging existed
+    view = device_view(request.args, page_size=None)
+    # ETA badges only flip when the scheduler fires, and that bumps the version
+    etag = state_etag(device_view_key(view))
+
+    def build():
+        conn = get_db()
+        try:
+            return dict(device_page(conn, view), version=state_version())
+        finally:
+            conn.close()
+
+    return conditional_json(etag, build)
+
+@app.route("/api/logs")
+def api_logs():
+    limit = min(max(request.args.get("limit", HISTORY_LIMIT, type=int), 1), API_LOGS_MAX)
+    etag = state_etag(limit)
+
+    def build():
+        conn = get_db()
+        rows = conn.execute(HISTORY_SQL, (HISTORY_NEWEST, limit)).fetchall()
+        conn.close()
+        logs = []
+        for r in rows:
+            l = dict(r)
+            minutes = l.pop("minutes")
+            l["duration"] = format_minutes(minutes) if l["end_time"] else "-"
+            l["status"] = "Completed" if l["end_time"] else "Ongoing"
+            logs.append(l)
+        return {"version": state_version(), "logs": logs}
+
+    return conditional_json(etag, build)
+
+@app.route("/api/history")
+def api_history():
+    # ?before_id=<id of the oldest row already shown>; omitted for the first page
+    before_id = request.args.get("before_id", HISTORY_NEWEST, type=int)
+    limit = min(max(request.args.get("limit", HISTORY_LIMIT, type=int), 1), API_LOGS_MAX)
+    etag = state_etag("history", before_id, limit)
+
+    def build():
+        conn = get_db()
+        rows = conn.execute(HISTORY_SQL, (before_id, limit)).fetchall()
+        conn.close()
+        logs = [history_row(r) for r in rows]
+        # a short page means the start of the table was reached
+        next_before_id = logs[-1]["id"] if len(logs) == limit else None
+        return {"version": state_version(), "logs": logs, "next_before_id": next_before_id}
+
+    return conditional_json(etag, build)
+
+@app.route("/events")
+def events():
+    q = subscribe_events()
+
+    def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                try:
+                    yield q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    with _subscribers_lock:
+                        dropped = q not in _subscribers
+                    if dropped:
+                        return
+                    yield ": ping\n\n"  # keeps proxies from closing an idle stream
+        finally:
+            unsubscribe_events(q)
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route("/assets/<filename>")
+def asset(filename):
+    if filename not in ASSETS:
+        return make_response(("Not found", 404))
+    body, mimetype = ASSETS[filename]
+    response = Response(body, mimetype=mimetype)
+    # the name changes whenever the content does, so browsers may keep it forever
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+    return response
+
+# group -> (select columns, GROUP BY, ORDER BY) for /api/utilization
+UTILIZATION_GROUPS = {
+    "device": ("u.device_id, d.name AS device_name", "u.device_id", "busy_minutes DESC, u.device_id"),
+    "user": ("u.user", "u.user", "busy_minutes DESC, u.user"),
+    "day": ("u.day", "u.day", "u.day"),
+}
+
+@app.route("/api/utilization")
+def api_utilization():
+    """
+    Busy minutes and session counts from usage_daily (closed sessions only).
+    ?start_date=&end_date= (YYYY-MM-DD, default the last 30 days),
+    ?group=device|user|day, optional ?device_id= and ?user= filters.
+    """
+    group = request.args.get("group", "device")
+    if group not in UTILIZATION_GROUPS:
+        return jsonify({"error": "group must be device, user or day"}), 400
+    try:
+        end = date.fromisoformat(request.args.get("end_date") or date.today().isoformat())
+        start = date.fromisoformat(request.args.get("start_date") or (end - timedelta(days=29)).isoformat())
+    except ValueError:
+        return jsonify({"error": "invalid date, expected YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "start_date is after end_date"}), 400
+    device_id = request.args.get("device_id", type=int)
+    user = request.args.get("user", "").strip().upper()
+    etag = state_etag("utilization", hashlib.sha1(request.query_string).hexdigest()[:16],
+                      start.isoformat())  # default range moves at midnight
+
+    def build():
+        columns, group_by, order_by = UTILIZATION_GROUPS[group]
+        where = ["u.day >= ?", "u.day <= ?"]
+        params = [start.isoformat(), end.isoformat()]
+        if device_id is not None:
+            where.append("u.device_id = ?")
+            params.append(device_id)
+        if user:
+            where.append("u.user = ?")
+            params.append(user)
+        started = time.perf_counter()
+        conn = get_db()
+        rows = conn.execute(f"""
+            SELECT {columns}, SUM(u.busy_minutes) AS busy_minutes, SUM(u.sessions) AS sessions
+            FROM usage_daily u
+            LEFT JOIN devices d ON d.id = u.device_id
+            WHERE {" AND ".join(where)}
+            GROUP BY {group_by}
+            ORDER BY {order_by}
+        """, params).fetchall()
+        conn.close()
+        range_minutes = ((end - start).days + 1) * 24 * 60
+        result = []
+        for r in rows:
+            item = dict(r)
+            if group == "device":
+                item["utilization"] = round(item["busy_minutes"] / range_minutes, 4)
+            result.append(item)
+        return {
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "group": group,
+            "rows": result,
+            "query_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    return conditional_json(etag, build)
+
+@app.route("/api/reservations")
+def api_reservations():
+    """
+    Bookings overlapping ?from=&to= (ISO, default now .. the booking horizon),
+    optionally for one ?device_id=, ordered by start.
+    """
+    now = datetime.now().replace(second=0, microsecond=0)
+    window_start = parse_booking_time(request.args.get("from") or now.isoformat())
+    window_end = parse_booking_time(request.args.get("to") or
+                                    (now + timedelta(days=RESERVATION_HORIZON_DAYS)).isoformat())
+    if window_start is None or window_end is None:
+        return jsonify({"error": "invalid from/to, expected ISO date-times"}), 400
+    device_id = request.args.get("device_id", type=int)
+    limit = min(max(request.args.get("limit", API_LOGS_MAX, type=int), 1), API_LOGS_MAX)
+    etag = state_etag("reservations", device_id, epoch_minutes(window_start), epoch_minutes(window_end), limit)
+
+    def build():
+        conn = get_db()
+        if device_id is not None:
+            rows = reservation_conflicts(conn, device_id, epoch_minutes(window_start),
+                                         epoch_minutes(window_end))[:limit]
+        else:
+            rows = conn.execute("""
+                SELECT id, device_id, user, start_time, end_time, start_ts, end_ts
+                FROM reservations
+                WHERE end_ts > ? AND start_ts < ?
+                ORDER BY start_ts, device_id
+                LIMIT ?
+            """, (epoch_minutes(window_start), epoch_minutes(window_end), limit)).fetchall()
+        conn.close()
+        return {"version": state_version(), "reservations": [reservation_dict(r) for r in rows]}
+
+    return conditional_json(etag, build)
+
+@app.route("/api/reservations", methods=["POST"])
+@retry_on_busy
+def create_reservation():
+    """JSON body: {"device_id": ..., "user": ..., "start": ISO, "end": ISO}"""
+    body = request.get_json(silent=True) or {}
+    try:
+        device_id = int(body.get("device_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "device_id is required"}), 400
+    user = str(body.get("user") or "").strip().upper()
+    start = parse_booking_time(body.get("start"))
+    end = parse_booking_time(body.get("end"))
+    if not user or start is None or end is None:
+        return jsonify({"error": "user, start and end are required"}), 400
+    now = datetime.now().replace(second=0, microsecond=0)
+    if start < now or end <= start or end > now + timedelta(days=RESERVATION_HORIZON_DAYS):
+        return jsonify({"error": f"need now <= start < end <= {RESERVATION_HORIZON_DAYS} days ahead"}), 400
+    start_ts, end_ts = epoch_minutes(start), epoch_minutes(end)
+
+    conn = get_db()
+    try:
+        # IMMEDIATE: check and insert as one step, so two bookings can't both pass the check
+        conn.execute("BEGIN IMMEDIATE")
+        device = conn.execute("SELECT status, current_user, eta_ts FROM devices WHERE id=?",
+                              (device_id,)).fetchone()
+        if device is None:
+            conn.rollback()
+            return jsonify({"error": f"Device {device_id} does not exist."}), 404
+        # an overdue lock (or one without an ETA) has no known end, so it blocks any start
+        eta_ts = device["eta_ts"] or 0
+        if (device["status"] == "In Use" and device["current_user"] != user
+                and (eta_ts > start_ts or eta_ts <= epoch_minutes(now))):
+            conn.rollback()
+            until = "until its ETA" if eta_ts > start_ts else "past its ETA"
+            return jsonify({"error": f"Device {device_id} is locked by {device['current_user']} {until}."}), 409
+        clash = reservation_conflicts(conn, device_id, start_ts, end_ts)
+        if clash:
+            conn.rollback()
+            return jsonify({"error": f"Device {device_id} is already reserved for part of that time.",
+                            "conflict": reservation_dict(clash[0])}), 409
+        cur = conn.execute("""
+            INSERT INTO reservations (device_id, user, start_time, end_time, start_ts, end_ts)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (device_id, user, start.isoformat(timespec='minutes'), end.isoformat(timespec='minutes'),
+              start_ts, end_ts))
+        row = conn.execute("SELECT * FROM reservations WHERE id=?", (cur.lastrowid,)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    bump_state_version()
+    return jsonify(reservation_dict(row)), 201
+
+@app.route("/api/reservations/<int:reservation_id>", methods=["DELETE"])
+@retry_on_busy
+def cancel_reservation(reservation_id):
+    conn = get_db()
+    cur = conn.execute("DELETE FROM reservations WHERE id=?", (reservation_id,))
+    conn.commit()
+    conn.close()
+    if cur.rowcount != 1:
+        return jsonify({"error": f"Reservation {reservation_id} does not exist."}), 404
+    bump_state_version()
+    return Response(status=204)
+
+@app.route("/api/reservations/next_free")
+def next_free_slot():
+    """earliest ?minutes= long free slot on any device, at or after ?after= (ISO, default now)"""
+    now = datetime.now().replace(second=0, microsecond=0)
+    minutes = request.args.get("minutes", 60, type=int)
+    after = parse_booking_time(request.args.get("after") or now.isoformat())
+    if after is None or minutes is None or minutes < 1:
+        return jsonify({"error": "minutes must be a positive integer and after an ISO date-time"}), 400
+    after = max(after, now)
+    horizon = now + timedelta(days=RESERVATION_HORIZON_DAYS)
+
+    conn = get_db()
+    row = conn.execute(NEXT_FREE_SLOT_SQL, {"after": epoch_minutes(after), "now": epoch_minutes(now),
+                                            "minutes": minutes, "horizon": epoch_minutes(horizon)}).fetchone()
+    conn.close()
+    if row is None:
+        return jsonify({"minutes": minutes, "slot": None})
+    start = datetime.fromtimestamp(row["free_from"])
+    return jsonify({"minutes": minutes, "slot": {
+        "device_id": row["device_id"],
+        "device_name": row["device_name"],
+        "start": start.isoformat(timespec='minutes'),
+        "end": (start + timedelta(minutes=minutes)).isoformat(timespec='minutes'),
+        "free_until": (datetime.fromtimestamp(row["free_to"]).isoformat(timespec='minutes')
+                       if row["free_to"] is not None else None),
+    }})
+
+@app.route("/api/stats")
+def api_stats():
+    with _render_stats_lock:
+        stats = dict(render_cache_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / total, 3) if total else None
+    return jsonify({"version": state_version(), "render_cache": stats,
+                    "eta": {"scheduled": len(_eta_due), "overdue": len(_overdue)}})
+
+# ---------- log download formats ----------
+def iter_log_chunks(start_date, end_date):
+    """hot + archived LOG_EXPORT_SELECT rows for a day range, DOWNLOAD_CHUNK_ROWS at a time"""
+    sql, params = log_range_query(start_date, end_date)
+    conn = get_db()
+    cur = conn.execute(sql, params)
+    try:
+        # archived months in the range are merged in by start time
+        merged = merge_archived_logs(cur, start_date, end_date)
+        while True:
+            rows = list(itertools.islice(merged, DOWNLOAD_CHUNK_ROWS))
+            if not rows:
+                return
+            yield rows
+    finally:
+        cur.close()
+        conn.close()
+
+def log_record(r):
+    """one log row as plain values, for the non-CSV formats (no serials or partition rows)"""
+    return {
+        "id": r["id"],
+        "device_id": r["device_id"],
+        "device_name": r["device_name"],
+        "user": r["user"],
+        "start_time": r["start_time"],
+        "end_time": r["end_time"],
+        "minutes": r["minutes"] if r["end_time"] else None,
+        "status": "Completed" if r["end_time"] else "Ongoing",
+    }
+
+def csv_log_stream(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(LOG_HEADER)
+    yield buf.getvalue().encode("utf-8")  # first byte goes out before any rows are fetched
+    buf.seek(0)
+    buf.truncate()
+    state = {"last_date": None, "serial": 0}
+    for rows in chunks:
+        writer.writerows(fields for _, fields in iter_log_csv(rows, state))
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+
+def ndjson_log_stream(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(log_record(r), separators=(",", ":")) + "\n"
+                      for r in rows).encode("utf-8")
+
+def arrow_log_stream(chunks):
+    """Arrow IPC stream (zstd-compressed buffers): the schema, then a record batch per ARROW_BATCH_CHUNKS chunks"""
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("device_id", pa.int64()),
+        ("device_name", pa.string()),
+        ("user", pa.string()),
+        ("start_time", pa.timestamp("s")),
+        ("end_time", pa.timestamp("s")),
+        ("minutes", pa.int32()),
+        ("status", pa.dictionary(pa.int8(), pa.string())),
+    ])
+    out = io.BytesIO()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(out, schema, options=options) as writer:
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+        while True:
+            rows = [r for chunk in itertools.islice(chunks, ARROW_BATCH_CHUNKS) for r in chunk]
+            if not rows:
+                break
+            records = [log_record(r) for r in rows]
+            columns = {name: [rec[name] for rec in records] for name in schema.names}
+            batch = pa.record_batch([
+                pa.array(columns["id"], pa.int64()),
+                pa.array(columns["device_id"], pa.int64()),
+                pa.array(columns["device_name"], pa.string()),
+                pa.array(columns["user"], pa.string()),
+                # naive local times, parsed from the ISO text by Arrow rather than per row here
+                pa.array(columns["start_time"], pa.string()).cast(pa.timestamp("s")),
+                pa.array(columns["end_time"], pa.string()).cast(pa.timestamp("s")),
+                pa.array(columns["minutes"], pa.int32()),
+                pa.array(columns["status"], pa.string()).dictionary_encode().cast(schema.field("status").type),
+            ], schema=schema)
+            writer.write_batch(batch)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()  # end-of-stream marker
+
+def gzip_stream(pieces):
+    """gzip (not zlib) framing around a byte stream, flushed only at the end"""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for piece in pieces:
+        data = z.compress(piece)
+        if data:
+            yield data
+    yield z.flush()
+
+# format -> (stream, content type, file extension, gzip the stream)
+LOG_DOWNLOAD_FORMATS = {
+    "csv": (csv_log_stream, "text/csv; charset=utf-8", "csv", False),
+    "csv.gz": (csv_log_stream, "application/gzip", "csv.gz", True),
+    "ndjson": (ndjson_log_stream, "application/x-ndjson", "ndjson", False),
+    "ndjson.gz": (ndjson_log_stream, "application/gzip", "ndjson.gz", True),
+    "arrow": (arrow_log_stream, "application/vnd.apache.arrow.stream", "arrows", False),
+}
+
+def download_format_choices():
+    choices = [("csv", "CSV"), ("csv.gz", "CSV (gzip)"), ("ndjson", "NDJSON"), ("ndjson.gz", "NDJSON (gzip)")]
+    if pa is not None:
+        choices.append(("arrow", "Arrow"))
+    return choices
+
+@app.route("/download_logs")
+def download_logs():
+    start_date = request.args.get("start_date", "").strip()
+    end_date = request.args.get("end_date", "").strip()
+    fmt = request.args.get("format", "csv").strip().lower()
+
+    try:
+        start_date, end_date = normalize_log_range(start_date, end_date)
+    except ValueError:
+        return make_response(("Invalid date, expected YYYY-MM-DD", 400))
+    if fmt not in LOG_DOWNLOAD_FORMATS:
+        return make_response((f"Unknown format, expected one of: {', '.join(LOG_DOWNLOAD_FORMATS)}", 400))
+    if fmt == "arrow" and pa is None:
+        return make_response(("format=arrow needs the pyarrow package on the server", 400))
+    stream, content_type, extension, compress = LOG_DOWNLOAD_FORMATS[fmt]
+    filename = export_filename(start_date, end_date, fmt)
+
+    job = cached_export((start_date, end_date, fmt))
+    if job is not None:
+        # a background job already built exactly this, and nothing in the range changed since
+        return send_file(job["path"], mimetype=content_type, as_attachment=True, download_name=filename)
+
+    body = stream(iter_log_chunks(start_date, end_date))
+    if compress:
+        body = gzip_stream(body)
+
+    response = Response(body, content_type=content_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+def export_filename(start_date, end_date, fmt):
+    extension = LOG_DOWNLOAD_FORMATS[fmt][2]
+    if start_date or end_date:
+        return f"logs_{start_date or 'start'}_to_{end_date or 'end'}.{extension}"
+    return f"logs_all.{extension}"
+
+# ---------- background export jobs ----------
+# POST /api/exports starts (or reuses) a job that writes a download to
+# EXPORT_CACHE_DIR; jobs live in memory, keyed by id, and the finished ones
+# double as a cache keyed by (start_date, end_date, format) + the range's
+# log_day_changes stamp, so a repeat request for an unchanged range is a file send.
+# Each job is also saved as <id>.json next to its file: under serve the progress
+# poll or the download can land on a worker that didn't start the job
+_export_jobs = {}  # job id -> job dict
+_export_jobs_by_key = {}  # (start_date, end_date, format) -> newest job id
+_export_jobs_lock = threading.Lock()
+_export_pool = None
+
+def log_range_stamp(conn, start_date, end_date):
+    """changes whenever an export of [start_date, end_date] could come out differently"""
+    return conn.execute(
+        "SELECT COALESCE(MAX(seq), 0) AS s FROM log_day_changes WHERE (day >= ? AND day <= ?) OR day = '*'",
+        (start_date or "", end_date or "9999-12-31")
+    ).fetchone()["s"]
+
+def export_job_view(job):
+    view = {k: job[k] for k in ("id", "status", "start_date", "end_date", "format",
+                                "rows_done", "rows_total", "bytes", "error")}
+    if job["status"] == "done":
+        view["progress"] = 1.0
+    else:
+        # rows_total leaves out archived rows, so hold below 1.0 until the file is in place
+        view["progress"] = round(min(job["rows_done"] / job["rows_total"], 0.99), 3) if job["rows_total"] else 0.0
+    view["progress_url"] = url_for("export_job_status", job_id=job["id"])
+    view["download_url"] = url_for("export_job_download", job_id=job["id"]) if job["status"] == "done" else None
+    return view
+
+def _export_job_record(job_id):
+    return os.path.join(EXPORT_CACHE_DIR, f"{job_id}.json")
+
+def save_export_job(job):
+    record = dict(job, key=list(job["key"]))
+    tmp = _export_job_record(job["id"]) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f)
+    os.replace(tmp, _export_job_record(job["id"]))
+
+def find_export_job(job_id):
+    """the job from this process, else the record saved by the worker running it; None if unknown"""
+    job = _export_jobs.get(job_id)
+    if job is not None:
+        return job
+    try:
+        uuid.UUID(hex=job_id)
+        with open(_export_job_record(job_id), encoding="utf-8") as f:
+            job = json.load(f)
+    except (ValueError, OSError):
+        return None
+    job["key"] = tuple(job["key"])
+    if job["status"] in ("queued", "running"):
+        try:
+            os.kill(job["pid"], 0)
+        except ProcessLookupError:
+            job["status"], job["error"] = "failed", "the worker running this export exited"
+    return job
+
+def cached_export(key):
+    """the finished job for key if the range is unchanged since it started, else None"""
+    with _export_jobs_lock:
+        job = _export_jobs.get(_export_jobs_by_key.get(key))
+    if job is None or job["status"] != "done" or not os.path.exists(job["path"]):
+        return None
+    conn = get_db()
+    try:
+        stamp = log_range_stamp(conn, key[0], key[1])
+    finally:
+        conn.close()
+    return job if stamp == job["stamp"] else None
+
+def _prune_export_cache():
+    """drop the oldest finished jobs beyond EXPORT_CACHE_MAX_FILES; caller holds _export_jobs_lock"""
+    done = sorted((j for j in _export_jobs.values() if j["status"] in ("done", "failed")),
+                  key=lambda j: j["finished"])
+    for job in done[:max(len(done) - EXPORT_CACHE_MAX_FILES, 0)]:
+        del _export_jobs[job["id"]]
+        if _export_jobs_by_key.get(job["key"]) == job["id"]:
+            del _export_jobs_by_key[job["key"]]
+        for path in (job["path"], _export_job_record(job["id"])):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _run_export_job(job):
+    start_date, end_date, fmt = job["key"]
+    stream, _, _, compress = LOG_DOWNLOAD_FORMATS[fmt]
+    tmp = job["path"] + ".tmp"
+    try:
+        job["status"] = "running"
+        save_export_job(job)
+        saved = time.monotonic()
+
+        def counted(chunks):
+            nonlocal saved
+            for rows in chunks:
+                job["rows_done"] += len(rows)
+                if time.monotonic() - saved >= EXPORT_PROGRESS_SECONDS:
+                    save_export_job(job)
+                    saved = time.monotonic()
+                yield rows
+
+        body = stream(counted(iter_log_chunks(start_date, end_date)))
+        if compress:
+            body = gzip_stream(body)
+        with open(tmp, "wb") as f:
+            for piece in body:
+                f.write(piece)
+                job["bytes"] += len(piece)
+        os.replace(tmp, job["path"])
+        job["status"] = "done"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        traceback.print_exc()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    job["finished"] = time.time()
+    save_export_job(job)
+    with _export_jobs_lock:
+        _prune_export_cache()
+
+def start_export_job(start_date, end_date, fmt):
+    """(job, created) for a range: the cached or in-flight job for an unchanged range, else a new one"""
+    global _export_pool
+    key = (start_date, end_date, fmt)
+    conn = get_db()
+    try:
+        # read before the job's own queries: a write after this point bumps past it
+        stamp = log_range_stamp(conn, start_date, end_date)
+        where, params = log_range_where(start_date, end_date)
+        hot_rows = conn.execute(
+            "SELECT COUNT(*) AS n FROM logs l JOIN devices d ON d.id = l.device_id" + where, params
+        ).fetchone()["n"]
+    finally:
+        conn.close()
+
+    with _export_jobs_lock:
+        job = _export_jobs.get(_export_jobs_by_key.get(key))
+        if job is not None and job["stamp"] == stamp and job["status"] != "failed":
+            return job, False
+        os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "key": key,
+            "start_date": start_date,
+            "end_date": end_date,
+            "format": fmt,
+            "stamp": stamp,
+            "status": "queued",
+            "rows_done": 0,
+            # hot rows only - counting archived ones would mean reading the month files twice
+            "rows_total": hot_rows,
+            "bytes": 0,
+            "error": None,
+            "path": os.path.join(EXPORT_CACHE_DIR, f"{job_id}.{LOG_DOWNLOAD_FORMATS[fmt][2]}"),
+            "finished": None,
+            "pid": os.getpid(),
+        }
+        save_export_job(job)
+        _export_jobs[job_id] = job
+        _export_jobs_by_key[key] = job_id
+        if _export_pool is None:
+            _export_pool = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix="export-job")
+    _export_pool.submit(_run_export_job, job)
+    return job, True
+
+def reset_export_cache():
+    """jobs are in-memory only: files left by a previous run can't be matched to a stamp"""
+    if os.path.isdir(EXPORT_CACHE_DIR):
+        for name in os.listdir(EXPORT_CACHE_DIR):
+            os.remove(os.path.join(EXPORT_CACHE_DIR, name))
+
+@app.route("/api/exports", methods=["POST"])
+def create_export_job():
+    """
+    Start a background export. Form or JSON fields: start_date, end_date,
+    format (same values as /download_logs). 200 with a finished job when an
+    unchanged range is cached, else 202 with the job to poll.
+    """
+    data = request.get_json(silent=True) or request.form
+    start_date = str(data.get("start_date") or "").strip()
+    end_date = str(data.get("end_date") or "").strip()
+    fmt = str(data.get("format") or "csv").strip().lower()
+    try:
+        start_date, end_date = normalize_log_range(start_date, end_date)
+    except ValueError:
+        return jsonify({"error": "invalid date, expected YYYY-MM-DD"}), 400
+    if fmt not in LOG_DOWNLOAD_FORMATS:
+        return jsonify({"error": f"unknown format, expected one of: {', '.join(LOG_DOWNLOAD_FORMATS)}"}), 400
+    if fmt == "arrow" and pa is None:
+        return jsonify({"error": "format=arrow needs the pyarrow package on the server"}), 400
+
+    job, _ = start_export_job(start_date, end_date, fmt)
+    return jsonify(export_job_view(job)), 200 if job["status"] == "done" else 202
+
+@app.route("/api/exports/<job_id>")
+def export_job_status(job_id):
+    job = find_export_job(job_id)
+    if job is None:
+        return jsonify({"error": "unknown export job"}), 404
+    return jsonify(export_job_view(job))
+
+@app.route("/api/exports/<job_id>/download")
+def export_job_download(job_id):
+    job = find_export_job(job_id)
+    if job is None:
+        return jsonify({"error": "unknown export job"}), 404
+    if job["status"] != "done":
+        return jsonify(export_job_view(job)), 409
+    return send_file(job["path"], mimetype=LOG_DOWNLOAD_FORMATS[job["format"]][1], as_attachment=True,
+                     download_name=export_filename(job["start_date"], job["end_date"], job["format"]))
+
+# ---------- ASGI mode ----------
+# asgi_app serves the same routes for an ASGI server (serve-async runs it under
+# uvicorn). /events is answered natively: each stream is a coroutine waiting on
+# an asyncio.Queue, so idle live-update clients hold no thread. Every other
+# request goes through the Flask app on _asgi_pool, a dedicated executor that
+# keeps sqlite calls off the event loop; streamed responses are pulled one chunk
+# per hop, so a slow download only occupies a thread while a chunk is built.
+_asgi_pool = None
+
+def asgi_executor():
+    global _asgi_pool
+    if _asgi_pool is None:
+        _asgi_pool = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS, thread_name_prefix="asgi-wsgi")
+    return _asgi_pool
+
+def asgi_environ(scope, body):
+    """WSGI environ for an ASGI http scope, following the ASGI spec's WSGI mapping"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "wsgi.file_wrapper": lambda f, block_size=8192: FileWrapper(f, max(block_size, ASGI_FILE_BLOCK)),
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+        key = name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+async def _asgi_disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+def _wsgi_call(environ):
+    """run the Flask app and build the first chunk; returns (status, headers, result, chunks, first)"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = int(status.split(" ", 1)[0]), headers
+
+    result = app(environ, start_response)
+    chunks = iter(result)
+    return started["status"], started["headers"], result, chunks, _wsgi_pull(result, chunks)
+
+def _wsgi_pull(result, chunks):
+    """next body chunk, or None after closing the response when it is exhausted"""
+    chunk = next(chunks, None)
+    if chunk is None and hasattr(result, "close"):
+        result.close()
+    return chunk
+
+async def _asgi_wsgi(scope, receive, send):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    loop = asyncio.get_running_loop()
+    pool = asgi_executor()
+    status, headers, result, chunks, chunk = await loop.run_in_executor(pool, _wsgi_call, asgi_environ(scope, bytes(body)))
+    disconnected = asyncio.ensure_future(_asgi_disconnected(receive))
+    try:
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        # a client that went away mid-download stops the chunks nobody will read
+        while chunk is not None and not disconnected.done():
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await loop.run_in_executor(pool, _wsgi_pull, result, chunks)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        disconnected.cancel()
+        if chunk is not None and hasattr(result, "close"):
+            pool.submit(result.close)  # cut short: generators still hold pooled connections
+
+async def _asgi_events(receive, send):
+    """native /events: same stream as the Flask route, without a thread per client"""
+    loop = asyncio.get_running_loop()
+    q = subscribe_async_events(loop)
+
+    async def pump():
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        message = f"retry: {SSE_RETRY_MS}\n\n"
+        while True:
+            await send({"type": "http.response.body", "body": message.encode(), "more_body": True})
+            try:
+                message = await asyncio.wait_for(q.get(), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if not async_subscribed(loop, q):
+                    break
+                message = ": ping\n\n"  # keeps proxies from closing an idle stream
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    tasks = {asyncio.ensure_future(pump()), asyncio.ensure_future(_asgi_disconnected(receive))}
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+    finally:
+        unsubscribe_async_events(loop, q)
+
+async def _asgi_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, start_services)
+            except Exception as e:
+                traceback.print_exc()
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _asgi_pool is not None:
+                _asgi_pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def asgi_app(scope, receive, send):
+    """ASGI entry point, e.g. `uvicorn finalcode:asgi_app`; startup work runs on lifespan.startup"""
+    if scope["type"] == "lifespan":
+        await _asgi_lifespan(receive, send)
+    elif scope["type"] != "http":
+        raise ValueError(f"unsupported ASGI scope {scope['type']!r}")
+    elif scope["path"] == "/events" and scope["method"] == "GET":
+        await _asgi_events(receive, send)
+    else:
+        await _asgi_wsgi(scope, receive, send)
+
+# ---------- multi-process server (serve) ----------
+# The parent does the one-time startup work, opens the listening socket and
+# forks: N HTTP workers accept on the shared socket, and one housekeeper runs
+# what must happen exactly once - the logs.csv writer, backfills and archiving,
+# the ETA scheduler. The parent then only restarts children that exit. Processes
+# share the state version through shared memory and live-update events through
+# the events table. Export jobs and render caches stay per worker.
+def _exit_on_signal(signum, frame):
+    raise SystemExit(0)
+
+def _run_http_worker(sock, host, port):
+    global _serving_worker
+    _serving_worker = True
+    threading.Thread(target=_event_relay, name="event-relay", daemon=True).start()
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+def _run_housekeeper():
+    start_backfill()
+    start_export_worker()
+    start_eta_scheduler()
+    seen = state_version()
+    try:
+        while True:
+            time.sleep(WORKER_POLL_SECONDS)
+            if _log_rebuild_event.is_set():
+                _log_rebuild_event.clear()
+                request_log_rebuild()
+            version = state_version()
+            if version == seen:
+                continue
+            seen = version
+            # a worker wrote something: pick up its locks / unlocks and log rows
+            sync_eta_scheduler()
+            request_log_export()
+            conn = get_db()
+            try:
+                prune_event_log(conn)
+            finally:
+                conn.close()
+    finally:
+        stop_eta_scheduler()
+        stop_export_worker()
+
+def _fork_child(role, target, args):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+        signal.signal(signal.SIGINT, _exit_on_signal)
+        target(*args)
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 0
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)  # never fall back into the parent's supervise loop
+
+def run_workers(host, port, workers):
+    global _shared_version, _log_rebuild_event
+    if not hasattr(os, "fork"):
+        raise SystemExit("serve needs os.fork (Linux/macOS); use run or serve-async on this platform")
+    init_db()
+    reset_export_cache()
+    close_db_pool()  # nothing sqlite-related may cross the fork
+    _shared_version = multiprocessing.Value("q", 0)
+    _log_rebuild_event = multiprocessing.Event()
+    sock = socket.create_server((host, port), backlog=1024)
+
+    roles = [("housekeeper", _run_housekeeper, ())] + [("worker", _run_http_worker, (sock, host, port))] * workers
+    children = {}
+    for role in roles:
+        children[_fork_child(*role)] = role
+    print(f"Serving at http://127.0.0.1:{port} with {workers} worker processes")
+    print("Allowed hosts:", ALLOWED_HOST_IPS)
+
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+    try:
+        while True:
+            pid, status = os.wait()
+            role = children.pop(pid, None)
+            if role is None:
+                continue
+            print(f"[SERVER] {role[0]} {pid} exited ({os.waitstatus_to_exitcode(status)}), restarting")
+            time.sleep(1)  # a child that dies at startup shouldn't turn into a fork loop
+            children[_fork_child(*role)] = role
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            os.waitpid(pid, 0)
+        sock.close()
+
+# ---------- start ----------
+def start_services():
+    """one-time startup work shared by both serving modes"""
+    init_db()
+    start_backfill()
+    start_export_worker()
+    start_eta_scheduler()
+    reset_export_cache()
+
+def run_server():
+    # debug=True runs this script twice: the reloader's watcher and the serving
+    # child it (re)starts. Only the child, the one with WERKZEUG_RUN_MAIN, serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_services()
+    print("Starting server at http://127.0.0.1:5000")
+    print("Allowed hosts:", ALLOWED_HOST_IPS)
+    app.run(host="0.0.0.0", port=5000, debug=True)
+
+def run_async_server(host, port):
+    if uvicorn is None:
+        raise SystemExit("serve-async needs uvicorn: pip install uvicorn")
+    print(f"Starting async server at http://127.0.0.1:{port}")
+    print("Allowed hosts:", ALLOWED_HOST_IPS)
+    uvicorn.run(asgi_app, host=host, port=port, lifespan="on")
+
+def run_import(path):
+    init_db(sync_log_file=False)
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    names = parse_device_names(text, "json" if path.lower().endswith(".json") else "csv")
+    results, elapsed = import_devices(names)
+    summary = import_summary(results, elapsed)
+    for r in results:
+        if "id" in r:
+            print(f"row {r['row']}: {r['name']} -> id {r['id']}")
+        else:
+            print(f"row {r['row']}: skipped ({r['error']})")
+    print(f"Imported {summary['imported']}, failed {summary['failed']} "
+          f"in {summary['elapsed_ms']} ms ({summary['rows_per_sec']} rows/s)")
+    if reused_ids_have_logs([r["id"] for r in results if "id" in r]):
+        print(f"Some ids were reused and have past sessions: use Rebuild logs on the dashboard to refresh {LOG_FILE}")
+
+def run_archive(days):
+    init_db(sync_log_file=False)
+    backfill_usage_rollups()  # sessions must be in usage_daily before they can leave logs
+    moved = archive_logs(days)
+    print(f"Archived {moved} sessions; {LOG_ARCHIVE_DIR}/ now holds {len(archived_months())} month(s)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Device Availability Dashboard")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("run", help="start the dashboard server (default)")
+    p = sub.add_parser("serve", help="production server: several worker processes on one port")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=5000)
+    p.add_argument("--workers", type=int, default=SERVER_WORKERS,
+                   help=f"HTTP worker processes (default {SERVER_WORKERS}, the CPU count)")
+    p = sub.add_parser("serve-async", help="serve the dashboard through ASGI under uvicorn")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=5000)
+    p = sub.add_parser("import", help="bulk-add devices from a .csv or .json file of names")
+    p.add_argument("file")
+    p = sub.add_parser("archive", help="move old completed sessions to the compressed archive")
+    p.add_argument("--days", type=int, default=LOG_ARCHIVE_AFTER_DAYS,
+                   help=f"archive sessions that ended more than this many days ago (default {LOG_ARCHIVE_AFTER_DAYS})")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        run_import(args.file)
+    elif args.command == "archive":
+        run_archive(args.days)
+    elif args.command == "serve":
+        run_workers(args.host, args.port, max(args.workers, 1))
+    elif args.command == "serve-async":
+        run_async_server(args.host, args.port)
+    else:
+        run_server()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print("Failed to start:", e)
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,23 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import finalcode  # prints the allowed host IPs on import
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """a migrated devices.db (and logs.csv) in an empty working directory"""
+    monkeypatch.chdir(tmp_path)  # DB_PATH, LOG_FILE and the cache dirs are relative
+    finalcode.close_db_pool()
+    with contextlib.redirect_stdout(io.StringIO()):
+        finalcode.init_db()
+    yield finalcode
+    finalcode.stop_export_worker()
+    finalcode.close_db_pool()  # pooled connections point at this directory's database
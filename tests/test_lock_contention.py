@@ -0,0 +1,84 @@
+import contextlib
+import http.client
+import io
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+WORKERS = 50
+ROUNDS = 20  # lock or unlock requests per worker
+# contended requests/s must stay within this factor of the uncontended rate:
+# serialized retries or lock timeouts would drop it far below
+MIN_THROUGHPUT_RATIO = 0.3
+
+
+def hammer(port, device_id, workers, rounds):
+    """workers clients alternating lock / unlock on one device; (status counts, requests/s)"""
+    eta = (datetime.now() + timedelta(hours=2)).isoformat(timespec="minutes")
+    codes = Counter()
+    codes_lock = threading.Lock()
+
+    def worker(n):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        for i in range(rounds):
+            if (n + i) % 2 == 0:
+                action = "lock"
+                body = urllib.parse.urlencode({"user": f"w{n}", "eta": eta})
+            else:
+                action, body = "unlock", ""
+            conn.request("POST", f"/{action}/{device_id}", body=body, headers={
+                "Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            with codes_lock:
+                codes[action, response.status] += 1
+        conn.close()
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(workers) as pool:
+        list(pool.map(worker, range(workers)))
+    return codes, workers * rounds / (time.perf_counter() - started)
+
+
+def test_50_workers_never_double_lock_one_device(fresh_db, monkeypatch):
+    monkeypatch.setattr(WSGIRequestHandler, "log_request", lambda *a, **k: None)
+    fresh_db.start_export_worker()
+    server = make_server("127.0.0.1", 0, fresh_db.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        # the same number of requests from one client, on another device, as the baseline
+        _, baseline_rps = hammer(server.server_port, 2, 1, WORKERS * ROUNDS)
+        codes, contended_rps = hammer(server.server_port, 1, WORKERS, ROUNDS)
+    finally:
+        server.shutdown()
+
+    # no throughput collapse under contention
+    assert contended_rps >= MIN_THROUGHPUT_RATIO * baseline_rps, (contended_rps, baseline_rps)
+
+    # every request either won the compare-and-set (redirect) or got a clean conflict
+    assert set(status for _, status in codes) <= {302, 409}
+    assert codes["lock", 302] > 0
+    conn = fresh_db.get_db()
+    try:
+        sessions = conn.execute(
+            "SELECT id, user, end_time FROM logs WHERE device_id = 1 ORDER BY id").fetchall()
+        device = conn.execute("SELECT status, current_user FROM devices WHERE id = 1").fetchone()
+    finally:
+        conn.close()
+    open_sessions = [s for s in sessions if s["end_time"] is None]
+    assert len(open_sessions) <= 1
+    # one log row per successful lock, one closed row per successful unlock
+    assert len(sessions) == codes["lock", 302]
+    assert len(sessions) - len(open_sessions) == codes["unlock", 302]
+    # device row and log agree
+    if open_sessions:
+        assert device["status"] == "In Use" and device["current_user"] == open_sessions[0]["user"]
+    else:
+        assert device["status"] == "Available" and device["current_user"] is None
+    # only the newest session can still be open
+    assert all(s["end_time"] is not None for s in sessions[:-1])
@@ -0,0 +1,19 @@
+def test_hot_queries_are_index_backed(fresh_db):
+    conn = fresh_db.get_db()
+    try:
+        assert fresh_db.check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_plan_check_reports_a_dropped_index(fresh_db):
+    conn = fresh_db.get_db()
+    conn.execute("DROP INDEX idx_logs_start_time")
+    conn.close()
+    fresh_db.close_db_pool()  # pooled connections keep the plans prepared at startup
+    conn = fresh_db.get_db()
+    try:
+        failures = dict(fresh_db.check_query_plans(conn))
+    finally:
+        conn.close()
+    assert "download_logs range" in failures